@@ -0,0 +1,112 @@
+"""Compact columnar binary encoding for map point responses.
+
+Layout (all integers little-endian)::
+
+    magic      4 bytes  b"PTS1"
+    count      uint32   number of points (N)
+    columns    uint16   number of columns
+    column *   repeated:
+        name_len  uint16
+        name      utf-8 bytes
+        kind      uint8   (see KIND_*)
+        byte_len  uint32  length of the payload that follows
+        payload
+
+Column payloads:
+
+* ``KIND_FLOAT32`` - N x float32
+* ``KIND_UINT32``  - N x uint32
+* ``KIND_INT64``   - N x int64
+* ``KIND_DICT``    - uint16 dictionary size D, D x (uint16 len + utf-8),
+  then N x uint16 codes (0xFFFF = null)
+
+Timestamps are epoch seconds of the stored wall-clock time (no timezone
+conversion), 0 when missing.
+"""
+import calendar
+import struct
+import sys
+from array import array
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+MAGIC = b"PTS1"
+MEDIA_TYPE = "application/vnd.npp.points"
+
+KIND_FLOAT32 = 1
+KIND_UINT32 = 2
+KIND_INT64 = 3
+KIND_DICT = 4
+
+NULL_CODE = 0xFFFF
+
+_LITTLE = sys.byteorder == "little"
+
+
+def _packed(typecode: str, values: Iterable) -> bytes:
+    arr = array(typecode, values)
+    if not _LITTLE:
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _dict_column(values: Sequence[Optional[str]]) -> bytes:
+    index = {}
+    codes = array("H")
+    for value in values:
+        if value is None:
+            codes.append(NULL_CODE)
+            continue
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(index)
+        codes.append(code)
+    if len(index) >= NULL_CODE:
+        raise ValueError("too many distinct values for dictionary column")
+
+    out = bytearray(struct.pack("<H", len(index)))
+    for value in index:
+        encoded = str(value).encode("utf-8")
+        out += struct.pack("<H", len(encoded)) + encoded
+    if not _LITTLE:
+        codes.byteswap()
+    out += codes.tobytes()
+    return bytes(out)
+
+
+def epoch_seconds(value: Optional[datetime]) -> int:
+    return calendar.timegm(value.timetuple()) if value else 0
+
+
+class PointColumns:
+    """Collects named columns and serializes them in the PTS1 layout"""
+
+    def __init__(self, count: int):
+        self.count = count
+        self._columns: List[Tuple[str, int, bytes]] = []
+
+    def float32(self, name: str, values: Iterable[float]) -> "PointColumns":
+        self._columns.append((name, KIND_FLOAT32, _packed("f", values)))
+        return self
+
+    def uint32(self, name: str, values: Iterable[int]) -> "PointColumns":
+        self._columns.append((name, KIND_UINT32, _packed("I", values)))
+        return self
+
+    def int64(self, name: str, values: Iterable[int]) -> "PointColumns":
+        self._columns.append((name, KIND_INT64, _packed("q", values)))
+        return self
+
+    def dictionary(self, name: str, values: Sequence[Optional[str]]) -> "PointColumns":
+        self._columns.append((name, KIND_DICT, _dict_column(values)))
+        return self
+
+    def to_bytes(self) -> bytes:
+        out = bytearray(MAGIC)
+        out += struct.pack("<IH", self.count, len(self._columns))
+        for name, kind, payload in self._columns:
+            encoded = name.encode("utf-8")
+            out += struct.pack("<H", len(encoded)) + encoded
+            out += struct.pack("<BI", kind, len(payload))
+            out += payload
+        return bytes(out)
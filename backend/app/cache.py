@@ -1,102 +1,897 @@
 import os
-import json
-import redis
-from typing import Any, Optional
+import struct
+import time
+import zlib
+from collections import Counter, OrderedDict
+import asyncio
+import orjson
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from functools import wraps
+from fastapi import Response
 import hashlib
+import inspect
+from contextlib import contextmanager
+from . import timing
+from .metrics import CACHE_REQUESTS, REDIS_ERRORS, REDIS_LATENCY
+
+
+def dumps(value: Any) -> bytes:
+    """Encode a value to JSON bytes (non-native types fall back to str)"""
+    with timing.timed("serialize"):
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+@contextmanager
+def _redis_timer(operation: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        REDIS_LATENCY.observe(elapsed, operation)
+        timing.record("redis", elapsed)
+
+
+# Stored values start with a one-byte codec header
+CODEC_RAW = b"\x00"
+CODEC_ZLIB = b"\x01"
+COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "4096"))
+COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL", "1"))
+# Above this size (de)compression runs in a worker thread
+COMPRESS_OFFLOAD_BYTES = 256 * 1024
+
+# group -> [raw bytes, stored bytes] for values written to Redis
+_compression_stats: Dict[str, List[int]] = {}
+
+
+async def _run_codec(fn: Callable[..., bytes], data: bytes, *args: Any) -> bytes:
+    if len(data) >= COMPRESS_OFFLOAD_BYTES:
+        return await asyncio.to_thread(fn, data, *args)
+    return fn(data, *args)
+
+
+async def encode_value(key: str, value: bytes) -> bytes:
+    """Prefix a codec header, compressing values above the size threshold"""
+    stored = CODEC_RAW + value
+    if len(value) >= COMPRESS_MIN_BYTES:
+        compressed = await _run_codec(zlib.compress, value, COMPRESS_LEVEL)
+        if len(compressed) < len(value):
+            stored = CODEC_ZLIB + compressed
+    
+    counters = _compression_stats.setdefault(key.split(":", 1)[0], [0, 0])
+    counters[0] += len(value)
+    counters[1] += len(stored)
+    return stored
+
+
+async def decode_value(stored: Optional[bytes]) -> Optional[bytes]:
+    if stored is None:
+        return None
+    codec = stored[:1]
+    if codec == CODEC_ZLIB:
+        return await _run_codec(zlib.decompress, stored[1:])
+    if codec == CODEC_RAW:
+        return stored[1:]
+    # Written before codec headers existed
+    return stored
 
 
 class RedisCache:
-    _redis_client: Optional[redis.Redis] = None
+    """Async Redis client on a shared connection pool.
+
+    Every operation fails open: errors are logged and treated as a miss.
+    """
+    _pool: Optional[aioredis.BlockingConnectionPool] = None
+    _redis_client: Optional[aioredis.Redis] = None
 
     @classmethod
-    def get_client(cls) -> redis.Redis:
+    def get_client(cls) -> aioredis.Redis:
         if cls._redis_client is None:
             redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
-            cls._redis_client = redis.from_url(redis_url, decode_responses=True)
+            # 連線用滿時短暫等待釋放，而不是直接丟 MaxConnectionsError
+            cls._pool = aioredis.BlockingConnectionPool.from_url(
+                redis_url,
+                max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+                timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "0.2")),
+                socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "1.0")),
+                socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "1.0")),
+            )
+            cls._redis_client = aioredis.Redis(connection_pool=cls._pool)
         return cls._redis_client
 
+    @staticmethod
+    def subscriber_client() -> aioredis.Redis:
+        """Separate client for pub/sub: no socket timeout, since a subscription can sit idle indefinitely"""
+        return aioredis.from_url(
+            os.getenv("REDIS_URL", "redis://redis:6379/0"),
+            socket_timeout=None,
+            socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "1.0")),
+            health_check_interval=30,
+        )
+
+    @classmethod
+    async def close(cls) -> None:
+        if cls._redis_client is not None:
+            await cls._redis_client.aclose()
+            await cls._pool.disconnect()
+            cls._redis_client = None
+            cls._pool = None
+
     @classmethod
-    def get(cls, key: str) -> Any:
+    async def get(cls, key: str) -> Any:
+        value = await cls.get_raw(key)
+        if value:
+            try:
+                return orjson.loads(value)
+            except orjson.JSONDecodeError as e:
+                print(f"Redis get error: {e}")
+        return None
+
+    @classmethod
+    async def set(cls, key: str, value: Any, ttl: int = 300) -> bool:
+        return await cls.set_raw(key, dumps(value), ttl)
+
+    @classmethod
+    async def get_raw(cls, key: str) -> Optional[bytes]:
         try:
             client = cls.get_client()
-            value = client.get(key)
-            if value:
-                return json.loads(value)
+            with _redis_timer("get"):
+                stored = await client.get(key)
+            return await decode_value(stored)
         except Exception as e:
+            REDIS_ERRORS.inc("get")
             print(f"Redis get error: {e}")
         return None
 
     @classmethod
-    def set(cls, key: str, value: Any, ttl: int = 300) -> bool:
+    async def set_raw(cls, key: str, value: bytes, ttl: int = 300) -> bool:
         try:
             client = cls.get_client()
-            serialized_value = json.dumps(value, default=str)
-            return client.setex(key, ttl, serialized_value)
+            stored = await encode_value(key, value)
+            with _redis_timer("set"):
+                return bool(await client.setex(key, ttl, stored))
         except Exception as e:
+            REDIS_ERRORS.inc("set")
             print(f"Redis set error: {e}")
             return False
 
     @classmethod
-    def delete(cls, key: str) -> bool:
+    async def get_many(cls, keys: List[str]) -> List[Optional[bytes]]:
+        """Fetch several raw values in one pipelined round trip"""
+        if not keys:
+            return []
         try:
             client = cls.get_client()
-            return bool(client.delete(key))
+            async with client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.get(key)
+                with _redis_timer("get_many"):
+                    values = await pipe.execute()
+            return [await decode_value(v) for v in values]
         except Exception as e:
-            print(f"Redis delete error: {e}")
+            REDIS_ERRORS.inc("get_many")
+            print(f"Redis get error: {e}")
+            return [None] * len(keys)
+
+    @classmethod
+    async def set_many(cls, items: Dict[str, bytes], ttl: int = 300) -> bool:
+        """Store several raw values in one pipelined round trip"""
+        if not items:
+            return True
+        try:
+            client = cls.get_client()
+            encoded = {key: await encode_value(key, value) for key, value in items.items()}
+            async with client.pipeline(transaction=False) as pipe:
+                for key, value in encoded.items():
+                    pipe.setex(key, ttl, value)
+                with _redis_timer("set_many"):
+                    await pipe.execute()
+            return True
+        except Exception as e:
+            REDIS_ERRORS.inc("set_many")
+            print(f"Redis set error: {e}")
             return False
 
     @classmethod
-    def clear_pattern(cls, pattern: str) -> int:
-        """Clear keys matching a pattern (e.g., 'kpis:*')"""
+    async def delete(cls, key: str) -> bool:
         try:
             client = cls.get_client()
-            keys = client.keys(pattern)
-            if keys:
-                return client.delete(*keys)
-            return 0
+            with _redis_timer("delete"):
+                return bool(await client.delete(key))
         except Exception as e:
-            print(f"Redis clear pattern error: {e}")
-            return 0
+            REDIS_ERRORS.inc("delete")
+            print(f"Redis delete error: {e}")
+            return False
+
+
+class LocalCache:
+    """Bounded in-process LRU (L1) in front of Redis.
+
+    Entries are encoded bytes with a per-entry expiry; the total size is
+    capped at ``max_bytes`` and values larger than ``max_entry_bytes`` are
+    never stored.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int, max_ttl: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        if self.max_bytes <= 0 or len(value) > self.max_entry_bytes:
+            # Drop any older copy so it is not served over the fresh value
+            self.invalidate(key)
+            return
+        expires_at = time.monotonic() + min(ttl, self.max_ttl)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value)
+        self._size += len(value)
+        while self._size > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, key: str) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+    def invalidate_prefix(self, prefix: str) -> int:
+        keys = [k for k in self._entries if k.startswith(prefix)]
+        for k in keys:
+            self._remove(k)
+        return len(keys)
+
+    def _remove(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._size -= len(value)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+local_cache = LocalCache(
+    max_bytes=int(os.getenv("CACHE_L1_MAX_BYTES", str(32 * 1024 * 1024))),
+    max_entry_bytes=int(os.getenv("CACHE_L1_MAX_ENTRY_BYTES", str(1024 * 1024))),
+    max_ttl=int(os.getenv("CACHE_L1_MAX_TTL", "60")),
+)
+
+# group -> {"l1_hits", "l2_hits", "misses"}
+_cache_stats: Dict[str, Dict[str, int]] = {}
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+_background_tasks: List[asyncio.Task] = []
+
+# Warmable functions: group -> func name -> (func, encode, ttl)
+warmers: Dict[str, Dict[str, Tuple[Callable[..., Awaitable[Any]], Callable[[Any], bytes], int]]] = {}
+# "group:func" -> Counter of encoded call arguments, flushed to Redis periodically
+_access_counts: Dict[str, Counter] = {}
+ACCESS_FLUSH_INTERVAL = 30
+# 熱門 key 依天分桶：每桶只留前 HOT_KEYS_PER_FUNC 名，較舊的桶權重逐日減半
+ACCESS_BUCKET_SECONDS = 24 * 3600
+ACCESS_BUCKETS = 7
+HOT_KEYS_PER_FUNC = int(os.getenv("CACHE_HOT_KEYS_PER_FUNC", "200"))
+
+# group -> (generation, refresh deadline); pub/sub drops entries early
+_generations: Dict[str, Tuple[int, float]] = {}
+GENERATION_REFRESH = float(os.getenv("CACHE_GENERATION_REFRESH", "5"))
+MAX_KEY_LENGTH = 200
+
+# In-flight computations per cache key (single flight)
+_inflight: Dict[str, asyncio.Task] = {}
+
+# Cross-process lock: lock expiry, how long followers poll, poll interval (s)
+LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", "30"))
+LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", "10"))
+LOCK_POLL_INTERVAL = 0.05
+
+
+_OUTCOME_LABELS = {
+    "l1_hits": "l1_hit",
+    "l2_hits": "l2_hit",
+    "misses": "miss",
+    "stale_hits": "stale_hit",
+    "fallback_hits": "fallback_hit",
+}
+
+
+def _record(group: str, outcome: str) -> None:
+    counters = _cache_stats.setdefault(group, dict.fromkeys(_OUTCOME_LABELS, 0))
+    counters[outcome] += 1
+    CACHE_REQUESTS.inc(group, _OUTCOME_LABELS[outcome])
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Per-group L1/L2 hit counts, hit ratios and compression ratios"""
+    groups = {}
+    for group, counters in sorted(_cache_stats.items()):
+        total = counters["l1_hits"] + counters["l2_hits"] + counters["misses"]
+        hits = counters["l1_hits"] + counters["l2_hits"]
+        groups[group] = {
+            **counters,
+            "hit_ratio": hits / total if total else 0.0,
+            "l1_hit_ratio": counters["l1_hits"] / total if total else 0.0,
+        }
+    for group, (raw_bytes, stored_bytes) in sorted(_compression_stats.items()):
+        groups.setdefault(group, {}).update({
+            "bytes_raw": raw_bytes,
+            "bytes_stored": stored_bytes,
+            "compression_ratio": raw_bytes / stored_bytes if stored_bytes else 1.0,
+        })
+    return {"groups": groups, "l1": local_cache.stats()}
+
+
+async def _lookup(group: str, cache_key: str, ttl: int) -> Optional[bytes]:
+    body = local_cache.get(cache_key)
+    if body is not None:
+        _record(group, "l1_hits")
+        return body
+    
+    body = await RedisCache.get_raw(cache_key)
+    if body is not None:
+        _record(group, "l2_hits")
+        local_cache.set(cache_key, body, ttl)
+        return body
+    
+    _record(group, "misses")
+    return None
+
+
+async def _store(cache_key: str, body: bytes, ttl: int) -> None:
+    local_cache.set(cache_key, body, ttl)
+    await RedisCache.set_raw(cache_key, body, ttl)
+
+
+async def group_generation(group: str) -> int:
+    """Current generation of a cache group (cached in-process briefly)"""
+    cached = _generations.get(group)
+    now = time.monotonic()
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    
+    try:
+        generation = int(await RedisCache.get_client().get(f"cache_gen:{group}") or 0)
+    except Exception as e:
+        print(f"Redis get error: {e}")
+        return cached[0] if cached is not None else 0
+    _generations[group] = (generation, now + GENERATION_REFRESH)
+    return generation
+
+
+async def group_key(group: str, *parts: Any, generation: Optional[int] = None) -> str:
+    """Build a key inside a group's current (or the given) generation namespace
+
+    Keys longer than MAX_KEY_LENGTH keep their group, generation and first
+    part readable and replace the rest with a SHA-256 digest.
+    """
+    if generation is None:
+        generation = await group_generation(group)
+    prefix = f"{group}:g{generation}"
+    key = ":".join([prefix, *map(str, parts)])
+    if len(key) <= MAX_KEY_LENGTH or not parts:
+        return key
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return f"{prefix}:{parts[0]}:h:{digest}"
+
+
+async def _build_cache_key(key_prefix: str, func, args, kwargs, generation: Optional[int] = None) -> str:
+    # Create cache key from function name and arguments
+    cache_key_parts = [func.__name__]
+    
+    # Add args to cache key
+    for arg in args:
+        cache_key_parts.append(str(arg))
+    
+    # Add kwargs to cache key (sorted for consistency)
+    for k, v in sorted(kwargs.items()):
+        cache_key_parts.append(f"{k}={v}")
+    
+    return await group_key(key_prefix, *cache_key_parts, generation=generation)
+
+
+async def _compute_with_lock(cache_key: str, ttl: int, produce: Callable[[], Awaitable[bytes]]) -> bytes:
+    """Cross-process single flight: one process computes, the others poll Redis"""
+    lock = None
+    try:
+        lock = RedisCache.get_client().lock(f"lock:{cache_key}", timeout=LOCK_TIMEOUT)
+        acquired = await lock.acquire(blocking=False)
+    except Exception as e:
+        print(f"Redis lock error: {e}")
+        acquired = False
+        lock = None
+    
+    if lock is not None and not acquired:
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            body = await RedisCache.get_raw(cache_key)
+            if body is not None:
+                local_cache.set(cache_key, body, ttl)
+                return body
+        # Holder is too slow or gone - compute locally rather than fail
+    
+    try:
+        body = await produce()
+        await _store(cache_key, body, ttl)
+        return body
+    finally:
+        if acquired:
+            try:
+                await lock.release()
+            except Exception as e:
+                print(f"Redis lock release error: {e}")
+
+
+def _start_flight(
+    cache_key: str,
+    ttl: int,
+    produce: Callable[[], Awaitable[bytes]],
+    distributed_lock: bool = False,
+) -> asyncio.Task:
+    task = _inflight.get(cache_key)
+    if task is None:
+        async def compute() -> bytes:
+            if distributed_lock:
+                return await _compute_with_lock(cache_key, ttl, produce)
+            body = await produce()
+            await _store(cache_key, body, ttl)
+            return body
+        
+        task = asyncio.create_task(compute())
+        _inflight[cache_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(cache_key, None))
+    return task
+
 
+async def _single_flight(
+    cache_key: str,
+    ttl: int,
+    produce: Callable[[], Awaitable[bytes]],
+    distributed_lock: bool = False,
+) -> bytes:
+    """Run at most one computation per key in this process; callers share it.
 
-def cache_result(key_prefix: str, ttl: int = 300):
-    """Decorator to cache function results"""
+    The computation runs in its own task so a disconnecting caller does not
+    cancel it for everyone else waiting on the same key.
+    """
+    return await asyncio.shield(_start_flight(cache_key, ttl, produce, distributed_lock))
+
+
+def _log_refresh_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Cache refresh error: {task.exception()}")
+
+
+async def _refresh_in_background(
+    cache_key: str,
+    ttl: int,
+    produce: Callable[[], Awaitable[bytes]],
+) -> None:
+    """Recompute a stale entry without blocking the caller.
+
+    A short-lived Redis marker keeps other processes from refreshing the
+    same key at the same time.
+    """
+    if cache_key in _inflight:
+        return
+    try:
+        claimed = await RedisCache.get_client().set(f"refresh:{cache_key}", b"1", nx=True, ex=int(LOCK_TIMEOUT))
+    except Exception as e:
+        print(f"Redis lock error: {e}")
+        claimed = True
+    if claimed:
+        _start_flight(cache_key, ttl, produce).add_done_callback(_log_refresh_error)
+
+
+_SWR_MAGIC = b"SWR1"
+_SWR_HEADER = len(_SWR_MAGIC) + 8
+
+
+def _wrap_fresh_until(body: bytes, ttl: int) -> bytes:
+    return _SWR_MAGIC + struct.pack("<d", time.time() + ttl) + body
+
+
+def _unwrap_fresh_until(envelope: bytes) -> Tuple[float, bytes]:
+    if not envelope.startswith(_SWR_MAGIC):
+        # Entry written without a soft TTL - serve it, but treat it as stale
+        return 0.0, envelope
+    return struct.unpack_from("<d", envelope, len(_SWR_MAGIC))[0], envelope[_SWR_HEADER:]
+
+
+class Fallback:
+    """Degraded result to return from a cache_result function when a
+    dependency is down. It is kept apart from real results, for
+    ``negative_ttl`` seconds only, and never replaces a cached value.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+
+class _Degraded(Exception):
+    def __init__(self, body: bytes):
+        super().__init__("fallback result")
+        self.body = body
+
+
+async def _lookup_fallback(group: str, fallback_key: str) -> Optional[bytes]:
+    body = local_cache.get(fallback_key)
+    if body is None:
+        body = await RedisCache.get_raw(fallback_key)
+    if body is not None:
+        _record(group, "fallback_hits")
+    return body
+
+
+def _hot_bucket(now: Optional[float] = None) -> int:
+    return int((time.time() if now is None else now) // ACCESS_BUCKET_SECONDS)
+
+
+def _record_access(group: str, func_name: str, args, kwargs) -> None:
+    # 排序 kwargs，呼叫時參數順序不同也算同一個 key
+    member = orjson.dumps({"args": list(args), "kwargs": kwargs}, default=str, option=orjson.OPT_SORT_KEYS)
+    _access_counts.setdefault(f"{group}:{func_name}", Counter())[member] += 1
+
+
+async def flush_access_counts() -> None:
+    """Push in-process access counts to today's cache_hot:* sorted sets, keeping the top entries"""
+    global _access_counts
+    if not _access_counts:
+        return
+    counts, _access_counts = _access_counts, {}
+    bucket = _hot_bucket()
+    try:
+        async with RedisCache.get_client().pipeline(transaction=False) as pipe:
+            for name, counter in counts.items():
+                hot_key = f"cache_hot:{name}:{bucket}"
+                for member, count in counter.items():
+                    pipe.zincrby(hot_key, count, member)
+                pipe.zremrangebyrank(hot_key, 0, -(HOT_KEYS_PER_FUNC + 1))
+                pipe.expire(hot_key, ACCESS_BUCKETS * ACCESS_BUCKET_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        print(f"Redis access count error: {e}")
+
+
+async def hot_members(group: str, func_name: str, top_n: int) -> List[bytes]:
+    """Most requested call arguments over the last ACCESS_BUCKETS days, older days weighted down"""
+    current = _hot_bucket()
+    async with RedisCache.get_client().pipeline(transaction=False) as pipe:
+        for age in range(ACCESS_BUCKETS):
+            pipe.zrange(f"cache_hot:{group}:{func_name}:{current - age}", 0, -1, withscores=True)
+        buckets = await pipe.execute()
+    
+    scores: Counter = Counter()
+    for age, entries in enumerate(buckets):
+        for member, score in entries:
+            scores[member] += score * 0.5 ** age
+    return [member for member, _ in scores.most_common(top_n)]
+
+
+def cache_result(
+    key_prefix: str,
+    ttl: int = 300,
+    as_response: bool = False,
+    distributed_lock: bool = False,
+    stale_ttl: int = 0,
+    warm: bool = False,
+    negative_ttl: int = 0,
+    warm_skip: Tuple[str, ...] = (),
+):
+    """Decorator to cache function results (in-process L1, then Redis)
+
+    Concurrent misses for the same key share a single computation. With
+    ``distributed_lock=True`` a Redis lock extends that across processes.
+
+    With ``stale_ttl`` > 0, ``ttl`` becomes a soft TTL: for another
+    ``stale_ttl`` seconds callers get the stale value immediately while a
+    background task recomputes it.
+
+    With ``as_response=True`` the result is stored as pre-encoded JSON bytes
+    and returned as a ``Response``, so a cache hit skips decoding and
+    re-encoding entirely. Only use it for functions whose result is the
+    whole endpoint response body.
+
+    With ``warm=True`` call arguments are counted so the post-ETL warmer
+    (see warm_cache_groups) can precompute the most requested keys. Calls
+    that pass a value for any parameter named in ``warm_skip`` (free-form
+    input such as a viewport bbox) are not counted.
+
+    A function may return ``Fallback(value)`` when a dependency fails. The
+    value is served to callers but cached under a separate key for
+    ``negative_ttl`` seconds (not at all when 0), so an outage neither
+    overwrites nor outlives the real cached result. A failed background
+    refresh keeps serving the stale value.
+    """
+    hard_ttl = ttl + stale_ttl
+    
+    def encode(result: Any) -> bytes:
+        body = dumps(result)
+        return _wrap_fresh_until(body, ttl) if stale_ttl else body
+    
     def decorator(func):
+        if warm:
+            warmers.setdefault(key_prefix, {})[func.__name__] = (func, encode, hard_ttl)
+        signature = inspect.signature(func)
+        
+        def bounded(args, kwargs) -> bool:
+            if not warm_skip:
+                return True
+            bound = signature.bind_partial(*args, **kwargs).arguments
+            return all(bound.get(name) is None for name in warm_skip)
+        
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # Create cache key from function name and arguments
-            cache_key_parts = [key_prefix, func.__name__]
+            cache_key = await _build_cache_key(key_prefix, func, args, kwargs)
+            if warm and bounded(args, kwargs):
+                _record_access(key_prefix, func.__name__, args, kwargs)
             
-            # Add args to cache key
-            for arg in args:
-                cache_key_parts.append(str(arg))
+            fallback_key = f"{cache_key}:fallback"
             
-            # Add kwargs to cache key (sorted for consistency)
-            for k, v in sorted(kwargs.items()):
-                cache_key_parts.append(f"{k}={v}")
+            async def produce() -> bytes:
+                result = await func(*args, **kwargs)
+                if isinstance(result, Fallback):
+                    body = dumps(result.value)
+                    if negative_ttl:
+                        await _store(fallback_key, body, negative_ttl)
+                    raise _Degraded(body)
+                return encode(result)
             
-            cache_key = ":".join(cache_key_parts)
+            def finish(body: bytes) -> Any:
+                if as_response:
+                    return Response(content=body, media_type="application/json")
+                return orjson.loads(body)
             
             # Try to get from cache first
-            cached_result = RedisCache.get(cache_key)
-            if cached_result is not None:
-                return cached_result
+            body = await _lookup(key_prefix, cache_key, hard_ttl)
+            if body is None and negative_ttl:
+                fallback = await _lookup_fallback(key_prefix, fallback_key)
+                if fallback is not None:
+                    return finish(fallback)
+            if body is None:
+                # Cache miss - execute function once for all concurrent callers
+                try:
+                    body = await _single_flight(cache_key, hard_ttl, produce, distributed_lock)
+                except _Degraded as degraded:
+                    return finish(degraded.body)
+            
+            if stale_ttl:
+                fresh_until, body = _unwrap_fresh_until(body)
+                if fresh_until < time.time():
+                    _record(key_prefix, "stale_hits")
+                    await _refresh_in_background(cache_key, hard_ttl, produce)
             
-            # Cache miss - execute function
-            result = await func(*args, **kwargs)
+            return finish(body)
+        
+        async def cache_entries(*args, **kwargs) -> List[Tuple[str, int]]:
+            """(key, ttl) pairs a call would read, for prefetch()"""
+            cache_key = await _build_cache_key(key_prefix, func, args, kwargs)
+            entries = [(cache_key, hard_ttl)]
+            if negative_ttl:
+                entries.append((f"{cache_key}:fallback", negative_ttl))
+            return entries
+        
+        wrapper.cache_entries = cache_entries
+        return wrapper
+    return decorator
+
+
+async def prefetch(*calls: Tuple[Callable[..., Awaitable[Any]], tuple, dict]) -> int:
+    """Load the cache entries for several upcoming calls into L1 with a
+    single pipelined Redis round trip.
+
+    Each call is ``(cache_result-decorated func, args, kwargs)``; calling
+    the functions afterwards is then served from L1 where Redis had a value.
+    Returns the number of entries loaded.
+    """
+    keys: List[str] = []
+    ttls: Dict[str, int] = {}
+    for func, args, kwargs in calls:
+        for key, ttl in await func.cache_entries(*args, **kwargs):
+            if local_cache.get(key) is None:
+                keys.append(key)
+                ttls[key] = ttl
+    
+    loaded = 0
+    for key, body in zip(keys, await RedisCache.get_many(keys)):
+        if body is not None:
+            local_cache.set(key, body, ttls[key])
+            loaded += 1
+    return loaded
+
+
+def cache_bytes_result(key_prefix: str, ttl: int = 300, distributed_lock: bool = False):
+    """Decorator to cache functions that return raw bytes"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = await _build_cache_key(key_prefix, func, args, kwargs)
             
-            # Store in cache
-            RedisCache.set(cache_key, result, ttl)
+            cached_result = await _lookup(key_prefix, cache_key, ttl)
+            if cached_result is not None:
+                return cached_result
             
-            return result
+            async def produce() -> bytes:
+                return await func(*args, **kwargs)
+            return await _single_flight(cache_key, ttl, produce, distributed_lock)
         return wrapper
     return decorator
 
 
-def invalidate_cache_group(group: str):
-    """Invalidate all cache keys with a specific prefix"""
-    pattern = f"{group}:*"
-    cleared_count = RedisCache.clear_pattern(pattern)
-    print(f"Cleared {cleared_count} cache keys matching {pattern}")
-    return cleared_count
+async def invalidate_cache_group(group: str):
+    """Invalidate a cache group by moving it to a new generation.
+
+    This is O(1): old entries become unreachable and expire by their TTL.
+    Returns the new generation number.
+    """
+    try:
+        generation = int(await RedisCache.get_client().incr(f"cache_gen:{group}"))
+    except Exception as e:
+        print(f"Redis incr error: {e}")
+        return 0
+    _generations[group] = (generation, time.monotonic() + GENERATION_REFRESH)
+    
+    # Drop the local L1 copies and tell the other processes to do the same
+    local_cache.invalidate_prefix(f"{group}:")
+    try:
+        await RedisCache.get_client().publish(INVALIDATION_CHANNEL, group)
+    except Exception as e:
+        print(f"Redis publish error: {e}")
+    
+    print(f"Cache group {group} moved to generation {generation}")
+    return generation
+
+
+async def invalidate_cache_key(func: Callable[..., Awaitable[Any]], *args, **kwargs) -> List[str]:
+    """Drop the cached entries of one cache_result call (and its fallback)
+    everywhere, leaving the rest of its group untouched.
+
+    Pass the arguments exactly as callers do - positional and keyword
+    arguments produce different keys.
+    """
+    keys = [key for key, _ in await func.cache_entries(*args, **kwargs)]
+    for key in keys:
+        local_cache.invalidate(key)
+    try:
+        client = RedisCache.get_client()
+        await client.unlink(*keys)
+        for key in keys:
+            # Keys always contain ":", group names never do
+            await client.publish(INVALIDATION_CHANNEL, key)
+    except Exception as e:
+        print(f"Redis delete error: {e}")
+    return keys
+
+
+async def warm_cache_groups(groups: List[str], top_n: int = 20) -> Dict[str, Any]:
+    """Precompute the most requested keys into the next generation, then swap.
+
+    Values are written under generation N+1 while readers keep using N. The
+    generation counters of all groups are switched together only after every
+    key has been computed, so readers move from fully old to fully new data.
+    """
+    await flush_access_counts()
+    client = RedisCache.get_client()
+
+    gen_keys = {group: f"cache_gen:{group}" for group in groups}
+    current = {group: int(await client.get(gen_keys[group]) or 0) for group in groups}
+    report: Dict[str, Any] = {}
+
+    for group in groups:
+        target = current[group] + 1
+        warmed, failed = 0, 0
+        for func_name, (func, encode, ttl) in warmers.get(group, {}).items():
+            for member in await hot_members(group, func_name, top_n):
+                spec = orjson.loads(member)
+                args, kwargs = spec["args"], spec["kwargs"]
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    print(f"Cache warm error for {group}:{func_name}{args}{kwargs}: {e}")
+                    failed += 1
+                    continue
+                if isinstance(result, Fallback):
+                    failed += 1
+                    continue
+                body = encode(result)
+                key = await _build_cache_key(group, func, args, kwargs, generation=target)
+                await RedisCache.set_raw(key, body, ttl)
+                warmed += 1
+        report[group] = {"generation": target, "warmed": warmed, "failed": failed}
+
+    # Atomic swap - give up and fall back to a plain invalidation if another
+    # process moved a generation while we were warming
+    try:
+        async with client.pipeline(transaction=True) as pipe:
+            await pipe.watch(*gen_keys.values())
+            for group in groups:
+                if int(await pipe.get(gen_keys[group]) or 0) != current[group]:
+                    raise WatchError(group)
+            pipe.multi()
+            for group in groups:
+                pipe.set(gen_keys[group], current[group] + 1)
+            await pipe.execute()
+    except WatchError:
+        for group in groups:
+            report[group] = {"generation": await invalidate_cache_group(group), "warmed": 0, "failed": 0}
+        return report
+
+    for group in groups:
+        _generations[group] = (current[group] + 1, time.monotonic() + GENERATION_REFRESH)
+        local_cache.invalidate_prefix(f"{group}:")
+        await client.publish(INVALIDATION_CHANNEL, group)
+    return report
+
+
+async def _listen_for_invalidations() -> None:
+    while True:
+        client = RedisCache.subscriber_client()
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                data = message.get("data")
+                if isinstance(data, bytes):
+                    name = data.decode()
+                    if ":" in name:
+                        local_cache.invalidate(name)
+                        continue
+                    _generations.pop(name, None)
+                    local_cache.invalidate_prefix(f"{name}:")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Redis subscribe error: {e}")
+        finally:
+            # 重新訂閱前釋放連線，避免每次重試都留下一條
+            await pubsub.aclose()
+            await client.aclose()
+        await asyncio.sleep(5)
+
+
+async def _flush_access_counts_periodically() -> None:
+    while True:
+        await asyncio.sleep(ACCESS_FLUSH_INTERVAL)
+        await flush_access_counts()
+
+
+def start_cache_tasks() -> None:
+    """Start the L1 invalidation listener and access-count flusher (once, at startup)"""
+    if not _background_tasks:
+        _background_tasks.append(asyncio.create_task(_listen_for_invalidations()))
+        _background_tasks.append(asyncio.create_task(_flush_access_counts_periodically()))
+
+
+async def stop_cache_tasks() -> None:
+    for task in _background_tasks:
+        task.cancel()
+    for task in _background_tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _background_tasks.clear()
+    await flush_access_counts()
+
+
+async def get_data_version(name: str = "accident") -> int:
+    """Current data version, bumped by the ETL worker after every load"""
+    try:
+        return int(await RedisCache.get_client().get(f"data_version:{name}") or 0)
+    except Exception as e:
+        print(f"Redis get error: {e}")
+        return 0
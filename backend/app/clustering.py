@@ -0,0 +1,234 @@
+import math
+from typing import Any, Dict, List, Optional, Tuple
+from .db import MySQLPool
+
+
+# 伺服器端點位群聚：每個縮放等級一張格網（每格約 64px）
+# 格網只由後端建置：ETL 載入後呼叫 /etl/clusters/rebuild，行人資料上傳後直接重建
+MAX_CLUSTER_ZOOM = 14
+CELL_SHIFT = 2  # 每個 256px 圖磚切成 2^CELL_SHIFT x 2^CELL_SHIFT 格
+RAW_POINT_LIMIT = 5000
+
+CLUSTER_GRID_DDL = """
+    CREATE TABLE IF NOT EXISTS map_cluster_grid (
+        source VARCHAR(20) NOT NULL,
+        year INT NOT NULL,
+        category VARCHAR(50) NOT NULL DEFAULT '',
+        zoom TINYINT NOT NULL,
+        cell_x INT NOT NULL,
+        cell_y INT NOT NULL,
+        point_count INT NOT NULL DEFAULT 0,
+        fatal_count INT NOT NULL DEFAULT 0,
+        sum_lat DOUBLE NOT NULL DEFAULT 0,
+        sum_lng DOUBLE NOT NULL DEFAULT 0,
+        PRIMARY KEY (source, year, zoom, category, cell_x, cell_y),
+        INDEX idx_lookup (source, zoom, year, cell_x, cell_y)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+# Web Mercator 世界座標 (0~1) 轉格網座標
+_CELL_X_SQL = "FLOOR(({lng} + 180) / 360 * POW(2, z.zoom + {shift}))"
+_CELL_Y_SQL = (
+    "FLOOR((0.5 - LN((1 + SIN(RADIANS({lat}))) / (1 - SIN(RADIANS({lat})))) / (4 * PI()))"
+    " * POW(2, z.zoom + {shift}))"
+)
+
+_PEDESTRIAN_GRID_SQL = f"""
+    INSERT INTO map_cluster_grid (
+        source, year, category, zoom, cell_x, cell_y,
+        point_count, fatal_count, sum_lat, sum_lng
+    )
+    WITH RECURSIVE z (zoom) AS (
+        SELECT 0 UNION ALL SELECT zoom + 1 FROM z WHERE zoom < {MAX_CLUSTER_ZOOM}
+    )
+    SELECT
+        'pedestrian',
+        YEAR(p.occur_datetime) AS grid_year,
+        COALESCE(p.accident_type, '') AS grid_category,
+        z.zoom,
+        {_CELL_X_SQL.format(lng="p.longitude", shift=CELL_SHIFT)} AS grid_x,
+        {_CELL_Y_SQL.format(lat="p.latitude", shift=CELL_SHIFT)} AS grid_y,
+        COUNT(*),
+        COALESCE(SUM(p.death_count), 0),
+        SUM(p.latitude),
+        SUM(p.longitude)
+    FROM pedestrian_accidents p
+    CROSS JOIN z
+    WHERE p.latitude BETWEEN -85 AND 85
+    GROUP BY grid_year, grid_category, z.zoom, grid_x, grid_y
+"""
+
+_ACCIDENT_GRID_SQL = f"""
+    INSERT INTO map_cluster_grid (
+        source, year, category, zoom, cell_x, cell_y,
+        point_count, fatal_count, sum_lat, sum_lng
+    )
+    WITH RECURSIVE z (zoom) AS (
+        SELECT 0 UNION ALL SELECT zoom + 1 FROM z WHERE zoom < {MAX_CLUSTER_ZOOM}
+    )
+    SELECT
+        'accident',
+        a.year,
+        COALESCE(a.accident_category, '') AS grid_category,
+        z.zoom,
+        {_CELL_X_SQL.format(lng="a.lng", shift=CELL_SHIFT)} AS grid_x,
+        {_CELL_Y_SQL.format(lat="a.lat", shift=CELL_SHIFT)} AS grid_y,
+        COUNT(*),
+        COUNT(*),
+        SUM(a.lat),
+        SUM(a.lng)
+    FROM accident a
+    CROSS JOIN z
+    WHERE a.year = %s
+        AND a.severity = 'fatal'
+        AND a.lat IS NOT NULL
+        AND a.lng IS NOT NULL
+    GROUP BY a.year, grid_category, z.zoom, grid_x, grid_y
+"""
+
+
+def world_xy(lng: float, lat: float) -> Tuple[float, float]:
+    """Project WGS84 to Web Mercator world coordinates in [0, 1]"""
+    lat = max(min(lat, 85.0511), -85.0511)
+    sin_lat = math.sin(math.radians(lat))
+    x = (lng + 180.0) / 360.0
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return x, y
+
+
+def parse_bbox(bbox: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """Parse "west,south,east,north"; returns None when missing or malformed"""
+    if not bbox:
+        return None
+    try:
+        west, south, east, north = map(float, bbox.split(","))
+    except ValueError:
+        return None
+    return west, south, east, north
+
+
+async def rebuild_pedestrian_clusters() -> None:
+    """Rebuild the pedestrian cluster grid from pedestrian_accidents"""
+    async with MySQLPool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(CLUSTER_GRID_DDL)
+            await conn.begin()
+            try:
+                await cur.execute("DELETE FROM map_cluster_grid WHERE source = 'pedestrian'")
+                await cur.execute(_PEDESTRIAN_GRID_SQL)
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+
+
+async def rebuild_accident_clusters(year: int) -> None:
+    """Rebuild the fatal-accident cluster grid of one year"""
+    async with MySQLPool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(CLUSTER_GRID_DDL)
+            await conn.begin()
+            try:
+                await cur.execute(
+                    "DELETE FROM map_cluster_grid WHERE source = 'accident' AND year = %s", (year,)
+                )
+                await cur.execute(_ACCIDENT_GRID_SQL, (year,))
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+
+
+async def backfill_cluster_grid() -> None:
+    """Build grid rows for data loaded before map_cluster_grid existed (accident years, pedestrian)"""
+    async with MySQLPool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(CLUSTER_GRID_DDL)
+            await cur.execute("SELECT DISTINCT source, year FROM map_cluster_grid")
+            built = set(await cur.fetchall() or [])
+
+            await cur.execute("SELECT DISTINCT year FROM accident WHERE severity = 'fatal'")
+            missing = sorted(
+                year for (year,) in await cur.fetchall() or []
+                if year is not None and ("accident", year) not in built
+            )
+
+            await cur.execute("SELECT 1 FROM pedestrian_accidents LIMIT 1")
+            has_pedestrian = await cur.fetchone() is not None
+
+    for year in missing:
+        await rebuild_accident_clusters(year)
+        print(f"Backfilled accident cluster grid for {year}")
+
+    if has_pedestrian and not any(source == "pedestrian" for source, _ in built):
+        await rebuild_pedestrian_clusters()
+        print("Backfilled pedestrian cluster grid")
+
+
+async def fetch_clusters(
+    source: str,
+    zoom: int,
+    bbox: Tuple[float, float, float, float],
+    year: Optional[int],
+    category: str = "all",
+) -> List[Dict[str, Any]]:
+    """Aggregate grid cells inside bbox at the given zoom"""
+    west, south, east, north = bbox
+    scale = 2 ** (zoom + CELL_SHIFT)
+    min_x, min_y = world_xy(west, north)
+    max_x, max_y = world_xy(east, south)
+
+    where_clauses = [
+        "source = %s",
+        "zoom = %s",
+        "cell_x BETWEEN %s AND %s",
+        "cell_y BETWEEN %s AND %s",
+    ]
+    params: List[Any] = [
+        source,
+        zoom,
+        int(math.floor(min_x * scale)),
+        int(math.floor(max_x * scale)),
+        int(math.floor(min_y * scale)),
+        int(math.floor(max_y * scale)),
+    ]
+    if year:
+        where_clauses.append("year = %s")
+        params.append(year)
+    if category != "all":
+        where_clauses.append("category = %s")
+        params.append(category)
+
+    async with MySQLPool.acquire(readonly=True) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"""
+                SELECT
+                  SUM(point_count),
+                  SUM(fatal_count),
+                  SUM(sum_lat) / SUM(point_count),
+                  SUM(sum_lng) / SUM(point_count)
+                FROM map_cluster_grid
+                WHERE {" AND ".join(where_clauses)}
+                GROUP BY cell_x, cell_y
+                """,
+                params,
+            )
+            rows = await cur.fetchall() or []
+
+    return [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [float(row[3]), float(row[2])]  # lng, lat
+            },
+            "properties": {
+                "cluster": True,
+                "point_count": int(row[0]),
+                "fatal_count": int(row[1] or 0),
+            }
+        }
+        for row in rows
+        if row[0]
+    ]
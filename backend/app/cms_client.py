@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+import aiohttp
+from . import timing
+from .metrics import Gauge
+
+
+CMS_BASE_URL = os.getenv("CMS_BASE_URL", "http://cms:1337")
+
+# 熔斷器：連續失敗達門檻即開路，之後請求直接失敗，由背景探測決定何時恢復
+BREAKER_FAILURES = int(os.getenv("CMS_BREAKER_FAILURES", "5"))
+BREAKER_PROBE_INTERVAL = float(os.getenv("CMS_BREAKER_PROBE_INTERVAL", "10"))
+HEALTH_PATH = os.getenv("CMS_HEALTH_PATH", "/_health")
+
+
+class CMSUnavailable(Exception):
+    """CMS is down, timing out, answering 5xx, or the circuit is open"""
+
+
+class CMSClient:
+    """Application-scoped aiohttp session for Strapi calls.
+
+    Connections are kept alive and capped at ``CMS_MAX_CONNECTIONS``;
+    requests beyond the cap queue for a free connection within the same
+    ``CMS_TIMEOUT`` budget.
+
+    After ``CMS_BREAKER_FAILURES`` consecutive failures the circuit opens:
+    calls raise ``CMSUnavailable`` immediately while a background task
+    probes ``CMS_HEALTH_PATH`` and closes the circuit once it answers.
+    """
+    _session: Optional[aiohttp.ClientSession] = None
+    _failures = 0
+    _opened_at: Optional[float] = None
+    _probe_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def get_session(cls) -> aiohttp.ClientSession:
+        if cls._session is None or cls._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=int(os.getenv("CMS_MAX_CONNECTIONS", "20")),
+                keepalive_timeout=float(os.getenv("CMS_KEEPALIVE", "30")),
+                ttl_dns_cache=300,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=float(os.getenv("CMS_TIMEOUT", "3")),
+                sock_connect=float(os.getenv("CMS_CONNECT_TIMEOUT", "1")),
+            )
+            cls._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return cls._session
+
+    @classmethod
+    async def close(cls) -> None:
+        if cls._probe_task is not None:
+            cls._probe_task.cancel()
+            cls._probe_task = None
+        if cls._session is not None:
+            await cls._session.close()
+            cls._session = None
+
+    @classmethod
+    def is_open(cls) -> bool:
+        return cls._opened_at is not None
+
+    @classmethod
+    def breaker_state(cls) -> Dict[str, Any]:
+        return {
+            "open": cls.is_open(),
+            "consecutive_failures": cls._failures,
+            "open_for_seconds": round(time.monotonic() - cls._opened_at, 1) if cls.is_open() else 0.0,
+        }
+
+    @classmethod
+    def _record_success(cls) -> None:
+        cls._failures = 0
+        if cls._opened_at is not None:
+            print("CMS circuit closed")
+        cls._opened_at = None
+
+    @classmethod
+    def _record_failure(cls, reason: str) -> None:
+        cls._failures += 1
+        if cls._opened_at is None and cls._failures >= BREAKER_FAILURES:
+            cls._opened_at = time.monotonic()
+            print(f"CMS circuit opened after {cls._failures} failures: {reason}")
+            if cls._probe_task is None or cls._probe_task.done():
+                cls._probe_task = asyncio.create_task(cls._probe_until_healthy())
+
+    @classmethod
+    async def _probe_until_healthy(cls) -> None:
+        while cls.is_open():
+            await asyncio.sleep(BREAKER_PROBE_INTERVAL)
+            try:
+                async with cls.get_session().get(f"{CMS_BASE_URL}{HEALTH_PATH}") as response:
+                    if response.status < 500:
+                        cls._record_success()
+            except Exception as e:
+                print(f"CMS probe failed: {e!r}")
+
+    @classmethod
+    async def get_json(cls, path: str) -> Tuple[int, Any]:
+        """GET a CMS path; returns (status, parsed body or None when not 200)
+
+        Raises ``CMSUnavailable`` on connection errors, timeouts, 5xx and
+        while the circuit is open.
+        """
+        if cls.is_open():
+            raise CMSUnavailable("circuit open")
+
+        try:
+            with timing.timed("cms"):
+                async with cls.get_session().get(f"{CMS_BASE_URL}{path}") as response:
+                    status = response.status
+                    data = await response.json() if status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            cls._record_failure(repr(e))
+            raise CMSUnavailable(repr(e)) from e
+
+        if status >= 500:
+            cls._record_failure(f"HTTP {status}")
+            raise CMSUnavailable(f"HTTP {status}")
+        cls._record_success()
+        return status, data
+
+
+Gauge(
+    "cms_circuit_open",
+    "1 while the CMS circuit breaker is open",
+    collect=lambda: {(): int(CMSClient.is_open())},
+)
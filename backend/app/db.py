@@ -1,50 +1,309 @@
+import asyncio
 import os
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime
 from urllib.parse import urlparse
-from typing import Optional
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
 import aiomysql
+from . import timing
+from .metrics import DB_ACQUIRE_WAIT, Gauge
+
+
+SLOW_QUERY_SECONDS = float(os.getenv("DB_SLOW_QUERY_MS", "200")) / 1000
+slow_queries: Deque[Dict[str, Any]] = deque(maxlen=int(os.getenv("DB_SLOW_QUERY_LOG_SIZE", "100")))
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|REPLACE|UPDATE|DELETE)\b", re.IGNORECASE)
+_SQL_LOG_CHARS = 4000
+_PARAMS_LOG_CHARS = 1000
+
+
+async def _explain(conn: aiomysql.Connection, query: str, args: Any) -> Optional[List[Dict[str, Any]]]:
+    if not _EXPLAINABLE.match(query):
+        return None
+    try:
+        # 一般 Cursor 在 execute 後已讀完結果，可在同一連線上再跑 EXPLAIN
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            await cur.execute("EXPLAIN " + query, args)
+            return list(await cur.fetchall())
+    except Exception as e:
+        return [{"error": str(e)}]
+
+
+def _log_slow_query(query: str, args: Any, elapsed: float, plan: Optional[List[Dict[str, Any]]]) -> None:
+    entry = {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "duration_ms": round(elapsed * 1000, 1),
+        "path": timing.current_path(),
+        "sql": " ".join(query.split())[:_SQL_LOG_CHARS],
+        "params": repr(args)[:_PARAMS_LOG_CHARS],
+        "plan": plan,
+    }
+    slow_queries.append(entry)
+    print(f"Slow query ({entry['duration_ms']} ms) {entry['path']}: {entry['sql'][:200]}")
+
+
+class TimedCursor(aiomysql.Cursor):
+    """Cursor that adds to the request's DB time and logs slow statements with EXPLAIN"""
+    _executing_many = False
+
+    async def execute(self, query, args=None):
+        if self._executing_many:
+            return await super().execute(query, args)
+
+        start = time.perf_counter()
+        try:
+            result = await super().execute(query, args)
+        finally:
+            elapsed = time.perf_counter() - start
+            timing.record("db", elapsed)
+        if elapsed >= SLOW_QUERY_SECONDS:
+            _log_slow_query(query, args, elapsed, await _explain(self._connection, query, args))
+        return result
+
+    async def executemany(self, query, args):
+        self._executing_many = True
+        start = time.perf_counter()
+        try:
+            result = await super().executemany(query, args)
+        finally:
+            self._executing_many = False
+            elapsed = time.perf_counter() - start
+            timing.record("db", elapsed)
+        if elapsed >= SLOW_QUERY_SECONDS:
+            _log_slow_query(query, f"<{len(args or [])} rows>", elapsed, None)
+        return result
+
+
+
+class TimedSSCursor(aiomysql.SSCursor):
+    """Unbuffered cursor timed like TimedCursor.
+
+    Rows arrive while fetching, so DB time covers execute plus every fetch;
+    a slow statement is logged (with EXPLAIN) when the cursor is closed,
+    after its result set has been drained.
+    """
+    _query: Optional[str] = None
+    _args: Any = None
+    _elapsed = 0.0
+
+    @contextmanager
+    def _timed(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._elapsed += elapsed
+            timing.record("db", elapsed)
+
+    async def execute(self, query, args=None):
+        self._query, self._args, self._elapsed = query, args, 0.0
+        with self._timed():
+            return await super().execute(query, args)
+
+    async def fetchone(self):
+        with self._timed():
+            return await super().fetchone()
+
+    async def fetchmany(self, size=None):
+        with self._timed():
+            return await super().fetchmany(size)
+
+    # fetchall() goes through fetchone(), so it is already timed
+
+    async def close(self):
+        conn = self._connection
+        with self._timed():
+            await super().close()
+        if conn is not None and self._query is not None and self._elapsed >= SLOW_QUERY_SECONDS:
+            _log_slow_query(self._query, self._args, self._elapsed, await _explain(conn, self._query, self._args))
+        self._query = None
+
+
+def _connect_kwargs(db_url: Optional[str]) -> Dict[str, Any]:
+    if db_url:
+        parsed = urlparse(db_url)
+        return {
+            "user": parsed.username or os.getenv("MYSQL_USER", "traffic"),
+            "password": parsed.password or os.getenv("MYSQL_PASSWORD", "changeme"),
+            "host": parsed.hostname or os.getenv("MYSQL_HOST", "mysql"),
+            "port": parsed.port or int(os.getenv("MYSQL_PORT", "3306")),
+            "db": (parsed.path or "/traffic").lstrip("/"),
+        }
+    return {
+        "user": os.getenv("MYSQL_USER", "traffic"),
+        "password": os.getenv("MYSQL_PASSWORD", "changeme"),
+        "host": os.getenv("MYSQL_HOST", "mysql"),
+        "port": int(os.getenv("MYSQL_PORT", "3306")),
+        "db": os.getenv("MYSQL_DATABASE", "traffic"),
+    }
+
+
+def _pool_options(prefix: str) -> Dict[str, Any]:
+    """Pool sizing/timeouts from <prefix>_POOL_MIN, _POOL_MAX, _CONNECT_TIMEOUT, _POOL_RECYCLE"""
+    return {
+        "minsize": int(os.getenv(f"{prefix}_POOL_MIN", os.getenv("DB_POOL_MIN", "1"))),
+        "maxsize": int(os.getenv(f"{prefix}_POOL_MAX", os.getenv("DB_POOL_MAX", "10"))),
+        "connect_timeout": float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", os.getenv("DB_CONNECT_TIMEOUT", "5"))),
+        # 秒；超過即重新連線，避免被 MySQL wait_timeout 關閉的閒置連線
+        "pool_recycle": int(os.getenv(f"{prefix}_POOL_RECYCLE", os.getenv("DB_POOL_RECYCLE", "3600"))),
+    }
+
+
+# 設為 True 時唯讀查詢也走主庫（例如 ETL 後暖快取，避免讀到複寫延遲的舊資料）
+_force_primary: ContextVar[bool] = ContextVar("force_primary", default=False)
 
 
 class MySQLPool:
+    """Primary pool plus an optional read-replica pool (``DB_READ_URL``).
+
+    Without ``DB_READ_URL`` read-only checkouts share the primary pool.
+    """
     _pool: Optional[aiomysql.Pool] = None
+    _read_pool: Optional[aiomysql.Pool] = None
+    # 避免並發的第一個請求各自建立連線池
+    _create_lock: Optional[asyncio.Lock] = None
+    # pool name -> [acquires, total wait seconds, max wait seconds, waiting now]
+    _acquire_stats: Dict[str, list] = {}
+
+    @classmethod
+    def _lock(cls) -> asyncio.Lock:
+        if cls._create_lock is None:
+            cls._create_lock = asyncio.Lock()
+        return cls._create_lock
 
     @classmethod
     async def create_pool(cls) -> aiomysql.Pool:
         if cls._pool is not None:
             return cls._pool
+        async with cls._lock():
+            if cls._pool is None:
+                cls._pool = await cls._open_pool(os.getenv("DB_URL"), "DB")
+        return cls._pool
 
-        db_url = os.getenv("DB_URL")
-        if db_url:
-            parsed = urlparse(db_url)
-            user = parsed.username or os.getenv("MYSQL_USER", "traffic")
-            password = parsed.password or os.getenv("MYSQL_PASSWORD", "changeme")
-            host = parsed.hostname or os.getenv("MYSQL_HOST", "mysql")
-            port = parsed.port or int(os.getenv("MYSQL_PORT", "3306"))
-            db = (parsed.path or "/traffic").lstrip("/")
-        else:
-            user = os.getenv("MYSQL_USER", "traffic")
-            password = os.getenv("MYSQL_PASSWORD", "changeme")
-            host = os.getenv("MYSQL_HOST", "mysql")
-            port = int(os.getenv("MYSQL_PORT", "3306"))
-            db = os.getenv("MYSQL_DATABASE", "traffic")
-
-        cls._pool = await aiomysql.create_pool(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            db=db,
-            minsize=1,
-            maxsize=5,
+    @classmethod
+    async def create_read_pool(cls) -> aiomysql.Pool:
+        read_url = os.getenv("DB_READ_URL")
+        if not read_url:
+            return await cls.create_pool()
+        if cls._read_pool is not None:
+            return cls._read_pool
+        async with cls._lock():
+            if cls._read_pool is None:
+                cls._read_pool = await cls._open_pool(read_url, "DB_READ")
+        return cls._read_pool
+
+    @staticmethod
+    async def _open_pool(db_url: Optional[str], prefix: str) -> aiomysql.Pool:
+        return await aiomysql.create_pool(
+            **_connect_kwargs(db_url),
+            **_pool_options(prefix),
             autocommit=True,
             charset="utf8mb4",
+            cursorclass=TimedCursor,
         )
-        return cls._pool
+
+    @classmethod
+    @asynccontextmanager
+    async def acquire(cls, readonly: bool = False) -> AsyncIterator[aiomysql.Connection]:
+        """Check out a connection, recording how long the pool made us wait.
+
+        ``readonly=True`` routes to the replica pool when one is configured.
+        """
+        if readonly and not _force_primary.get():
+            pool = await cls.create_read_pool()
+        else:
+            pool = await cls.create_pool()
+        name = "read" if pool is cls._read_pool else "primary"
+        stats = cls._acquire_stats.setdefault(name, [0, 0.0, 0.0, 0])
+
+        start = time.perf_counter()
+        stats[3] += 1
+        try:
+            conn = await pool.acquire()
+        finally:
+            stats[3] -= 1
+        waited = time.perf_counter() - start
+        stats[0] += 1
+        stats[1] += waited
+        stats[2] = max(stats[2], waited)
+        DB_ACQUIRE_WAIT.observe(waited, name)
+
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
+
+    @staticmethod
+    @contextmanager
+    def primary_reads() -> Iterator[None]:
+        """Send read-only checkouts to the primary inside this block"""
+        token = _force_primary.set(True)
+        try:
+            yield
+        finally:
+            _force_primary.reset(token)
+
+    @classmethod
+    def _pools(cls) -> Dict[str, aiomysql.Pool]:
+        pools = {}
+        if cls._pool is not None:
+            pools["primary"] = cls._pool
+        if cls._read_pool is not None:
+            pools["read"] = cls._read_pool
+        return pools
+
+    @classmethod
+    def pool_usage(cls) -> Dict[Tuple, float]:
+        usage = {}
+        for name, pool in cls._pools().items():
+            usage.update({
+                (name, "size"): pool.size,
+                (name, "free"): pool.freesize,
+                (name, "in_use"): pool.size - pool.freesize,
+                (name, "max"): pool.maxsize,
+                (name, "waiting"): cls._acquire_stats.get(name, [0, 0.0, 0.0, 0])[3],
+            })
+        return usage
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """Size, free connections and acquire wait times per pool"""
+        report = {}
+        for name, pool in cls._pools().items():
+            acquires, total_wait, max_wait, waiting = cls._acquire_stats.get(name, [0, 0.0, 0.0, 0])
+            report[name] = {
+                "minsize": pool.minsize,
+                "maxsize": pool.maxsize,
+                "size": pool.size,
+                "free": pool.freesize,
+                "in_use": pool.size - pool.freesize,
+                "waiting": waiting,
+                "acquires": acquires,
+                "avg_wait_ms": round(total_wait / acquires * 1000, 3) if acquires else 0.0,
+                "max_wait_ms": round(max_wait * 1000, 3),
+            }
+        return report
 
     @classmethod
     async def close_pool(cls) -> None:
+        if cls._read_pool is not None:
+            cls._read_pool.close()
+            await cls._read_pool.wait_closed()
+            cls._read_pool = None
         if cls._pool is not None:
             cls._pool.close()
             await cls._pool.wait_closed()
             cls._pool = None
 
 
+Gauge(
+    "db_pool_connections",
+    "MySQL pool connections by state",
+    ("pool", "state"),
+    collect=MySQLPool.pool_usage,
+)
@@ -1,12 +1,27 @@
-from fastapi import FastAPI
+import asyncio
+import os
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 
-from .routers import kpis, causes, segments, mapdata, etl, pedestrian, cms_content
-from .db import MySQLPool
+from .routers import kpis, causes, segments, mapdata, etl, pedestrian, cms_content, bundle
+from .db import SLOW_QUERY_SECONDS, MySQLPool, slow_queries
+from .cache import RedisCache, start_cache_tasks, stop_cache_tasks
+from .clustering import backfill_cluster_grid
+from .cms_client import CMSClient
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics
+from .timing import TimedORJSONResponse, timing_middleware
+
+
+async def _backfill_cluster_grid() -> None:
+    try:
+        await backfill_cluster_grid()
+    except Exception as e:
+        print(f"Cluster grid backfill failed: {e}")
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="Road Safety API", version="0.1.0")
+    app = FastAPI(title="Road Safety API", version="0.1.0", default_response_class=TimedORJSONResponse)
 
     app.add_middleware(
         CORSMiddleware,
@@ -16,6 +31,8 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    app.middleware("http")(timing_middleware)
+
     app.include_router(kpis.router, prefix="/api", tags=["kpis"])
     app.include_router(causes.router, prefix="/api", tags=["causes"])
     app.include_router(segments.router, prefix="/api", tags=["segments"])
@@ -23,17 +40,46 @@ def create_app() -> FastAPI:
     app.include_router(etl.router, prefix="/api", tags=["etl"])
     app.include_router(pedestrian.router, prefix="/api", tags=["pedestrian"])
     app.include_router(cms_content.router, prefix="/api", tags=["cms"])
+    app.include_router(bundle.router, prefix="/api", tags=["bundle"])
 
     @app.get("/api/health")
     async def health():
         return {"ok": True}
 
+    @app.get("/api/db/pool")
+    async def db_pool_stats():
+        return MySQLPool.stats()
+
+    @app.get("/api/debug/slow-queries")
+    async def get_slow_queries(secret: str | None = None):
+        expected = os.getenv("ETL_SECRET")
+        if expected and secret != expected:
+            raise HTTPException(status_code=401, detail="invalid secret")
+        return {"threshold_ms": SLOW_QUERY_SECONDS * 1000, "queries": list(reversed(slow_queries))}
+
+    @app.get("/api/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
     @app.on_event("startup")
     async def on_startup():
         await MySQLPool.create_pool()
+        await MySQLPool.create_read_pool()
+        CMSClient.get_session()
+        start_cache_tasks()
+        # 升級前已載入的資料補建群聚格網；在背景執行以免拖慢啟動
+        app.state.cluster_backfill = asyncio.create_task(_backfill_cluster_grid())
 
     @app.on_event("shutdown")
     async def on_shutdown():
+        app.state.cluster_backfill.cancel()
+        try:
+            await app.state.cluster_backfill
+        except asyncio.CancelledError:
+            pass
+        await stop_cache_tasks()
+        await CMSClient.close()
+        await RedisCache.close()
         await MySQLPool.close_pool()
 
     return app
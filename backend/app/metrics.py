@@ -0,0 +1,171 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms are plain dicts keyed by label values, updated
+from the event loop thread only, so recording costs a dict lookup and a
+few additions. Gauges are read from callbacks at scrape time.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 秒；涵蓋 Redis（亞毫秒）到慢查詢（數秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @contextmanager
+    def time(self, *labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self) -> Iterator[str]:
+        for labels, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(state[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Gauge(_Metric):
+    """Gauge whose samples come from a callback returning {label values: value}"""
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        collect: Callable[[], Dict[Tuple, float]] = dict,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._collect = collect
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self._collect().items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+def render_metrics() -> str:
+    return "".join(metric.render() for metric in _registry)
+
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "cache_result lookups by group and outcome",
+    ("group", "result"),
+)
+REDIS_LATENCY = Histogram(
+    "redis_operation_seconds",
+    "RedisCache operation latency",
+    ("operation",),
+)
+REDIS_ERRORS = Counter(
+    "redis_errors_total",
+    "RedisCache operations that failed (treated as a miss)",
+    ("operation",),
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_seconds",
+    "Duration of database query functions",
+    ("query",),
+)
+DB_ACQUIRE_WAIT = Histogram(
+    "db_pool_acquire_seconds",
+    "Time spent waiting for a MySQL pool connection",
+    ("pool",),
+)
+
+
+def timed_query(name: str = None):
+    """Record the duration of an async query function in DB_QUERY_DURATION"""
+    def decorator(func: Callable):
+        label = name or func.__name__
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with DB_QUERY_DURATION.time(label):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,129 @@
+import math
+import struct
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+# Mapbox Vector Tile (spec v2.1) - 只需要點圖層，直接手寫 protobuf 編碼
+EXTENT = 4096
+POINT = 1
+
+_WIRE_VARINT = 0
+_WIRE_64BIT = 1
+_WIRE_LEN = 2
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Return (west, south, east, north) in WGS84 degrees for a tile"""
+    n = 2 ** z
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def project(lng: float, lat: float, z: int, x: int, y: int, extent: int = EXTENT) -> Tuple[int, int]:
+    """Project a WGS84 point into tile-local integer coordinates"""
+    n = 2 ** z
+    lat = max(min(lat, 85.0511), -85.0511)
+    sin_lat = math.sin(math.radians(lat))
+    world_x = (lng + 180.0) / 360.0 * n
+    world_y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * n
+    return int(round((world_x - x) * extent)), int(round((world_y - y) * extent))
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field: int, wire: int) -> bytes:
+    return _varint((field << 3) | wire)
+
+
+def _len_field(field: int, payload: bytes) -> bytes:
+    return _key(field, _WIRE_LEN) + _varint(len(payload)) + payload
+
+
+def _packed(field: int, values: Iterable[int]) -> bytes:
+    return _len_field(field, b"".join(_varint(v) for v in values))
+
+
+def _encode_value(value: Any) -> bytes:
+    if isinstance(value, bool):
+        return _key(7, _WIRE_VARINT) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _key(5, _WIRE_VARINT) + _varint(value)
+        return _key(6, _WIRE_VARINT) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _key(3, _WIRE_64BIT) + struct.pack("<d", value)
+    return _len_field(1, str(value).encode("utf-8"))
+
+
+def encode_point_layer(
+    name: str,
+    features: List[Dict[str, Any]],
+    extent: int = EXTENT,
+) -> bytes:
+    """Encode a single point layer into an MVT tile.
+
+    Each feature is ``{"id": int | None, "xy": (x, y), "properties": {...}}``
+    with coordinates already in tile space (see ``project``).
+    """
+    if not features:
+        return b""
+
+    keys: List[str] = []
+    key_index: Dict[str, int] = {}
+    values: List[Any] = []
+    value_index: Dict[Tuple[type, Any], int] = {}
+
+    layer = bytearray()
+    layer += _key(15, _WIRE_VARINT) + _varint(2)
+    layer += _len_field(1, name.encode("utf-8"))
+
+    for feature in features:
+        tags: List[int] = []
+        for k, v in feature.get("properties", {}).items():
+            if v is None:
+                continue
+            if k not in key_index:
+                key_index[k] = len(keys)
+                keys.append(k)
+            vk = (type(v), v)
+            if vk not in value_index:
+                value_index[vk] = len(values)
+                values.append(v)
+            tags.extend((key_index[k], value_index[vk]))
+
+        px, py = feature["xy"]
+        body = bytearray()
+        feature_id: Optional[int] = feature.get("id")
+        if feature_id is not None:
+            body += _key(1, _WIRE_VARINT) + _varint(int(feature_id))
+        if tags:
+            body += _packed(2, tags)
+        body += _key(3, _WIRE_VARINT) + _varint(POINT)
+        # MoveTo(1) 指令 + zigzag 座標
+        body += _packed(4, (9, _zigzag(px), _zigzag(py)))
+        layer += _len_field(2, bytes(body))
+
+    for k in keys:
+        layer += _len_field(3, k.encode("utf-8"))
+    for v in values:
+        layer += _len_field(4, _encode_value(v))
+    layer += _key(5, _WIRE_VARINT) + _varint(extent)
+
+    return _len_field(3, bytes(layer))
@@ -1,37 +1,59 @@
 from typing import Any, Dict, List
+import pymysql
 from .db import MySQLPool
-from .cache import cache_result
+from .metrics import timed_query
+from .cache import cache_bytes_result, cache_result, get_data_version
+from .binary_points import PointColumns, epoch_seconds
+from .streaming import stream_rows
+from . import mvt
 
 
-@cache_result("kpis", ttl=300)
+MINOR_AGE_GROUPS = ("0-6", "7-12", "13-17")
+
+
+async def _count_fatal_kpis_rollup(cur, year: int):
+    await cur.execute(
+        """
+        SELECT
+          COALESCE(SUM(accident_count), 0) AS fatal_total,
+          COALESCE(SUM(CASE WHEN victim_type = '行人' THEN accident_count ELSE 0 END), 0) AS fatal_ped,
+          COALESCE(SUM(CASE WHEN age_group IN (%s, %s, %s) THEN accident_count ELSE 0 END), 0) AS fatal_minor
+        FROM kpi_rollup
+        WHERE year = %s AND severity = 'fatal'
+        """,
+        (*MINOR_AGE_GROUPS, year),
+    )
+    return await cur.fetchone() or (0, 0, 0)
+
+
+async def _count_fatal_kpis_live(cur, year: int):
+    # 使用 year 生成欄位，可走 idx_year_month 索引
+    await cur.execute(
+        """
+        SELECT
+          COUNT(*) AS fatal_total,
+          COALESCE(SUM(victim_type = '行人'), 0) AS fatal_ped,
+          COALESCE(SUM(age_group IN (%s, %s, %s)), 0) AS fatal_minor
+        FROM accident
+        WHERE year = %s AND severity = 'fatal'
+        """,
+        (*MINOR_AGE_GROUPS, year),
+    )
+    return await cur.fetchone() or (0, 0, 0)
+
+
+@cache_result("kpis", ttl=300, stale_ttl=86400, warm=True)
+@timed_query()
 async def fetch_kpis(year: int, baseline_year: int) -> Dict[str, Any]:
-    pool = await MySQLPool.create_pool()
-    async with pool.acquire() as conn:
+    async with MySQLPool.acquire(readonly=True) as conn:
         async with conn.cursor() as cur:
-            # fatal_total
-            await cur.execute(
-                """
-                SELECT COUNT(*)
-                FROM accident
-                WHERE severity = 'fatal' AND YEAR(occur_dt) = %s
-                """,
-                (year,),
-            )
-            (fatal_total,) = await cur.fetchone()
-
-            # ped / minors
-            await cur.execute(
-                """
-                SELECT
-                  SUM(victim_type = '行人') AS fatal_ped,
-                  SUM(age_group IN ('0-6','7-12','13-17')) AS fatal_minor
-                FROM accident
-                WHERE severity = 'fatal' AND YEAR(occur_dt) = %s
-                """,
-                (year,),
-            )
-            row = await cur.fetchone() or (0, 0)
-            fatal_ped, fatal_minor = row
+            # fatal_total / ped / minors（由 ETL 維護的彙總表讀取）
+            try:
+                row = await _count_fatal_kpis_rollup(cur, year)
+            except pymysql.err.ProgrammingError:
+                # 彙總表尚未建立（尚未跑過 ETL），改為即時計算
+                row = await _count_fatal_kpis_live(cur, year)
+            fatal_total, fatal_ped, fatal_minor = row
 
             # baseline
             await cur.execute(
@@ -65,10 +87,150 @@ async def fetch_kpis(year: int, baseline_year: int) -> Dict[str, Any]:
     }
 
 
-@cache_result("segments", ttl=300)
+_SERIES_SQL = """
+    SELECT
+      t.year,
+      COALESCE(SUM(t.fatal_total), 0),
+      COALESCE(SUM(t.fatal_ped), 0),
+      COALESCE(SUM(t.fatal_minor), 0),
+      b.fatal_total,
+      b.fatal_ped,
+      b.fatal_minor
+    FROM ({source}) AS t
+    CROSS JOIN (
+      SELECT
+        MAX(CASE WHEN metric = 'fatal_total' THEN value END) AS fatal_total,
+        MAX(CASE WHEN metric = 'fatal_ped' THEN value END) AS fatal_ped,
+        MAX(CASE WHEN metric = 'fatal_minor' THEN value END) AS fatal_minor
+      FROM kpi_baseline
+      WHERE baseline_year = %s
+    ) AS b
+    GROUP BY t.year, b.fatal_total, b.fatal_ped, b.fatal_minor
+    ORDER BY t.year
+"""
+
+_SERIES_ROLLUP_SOURCE = """
+      SELECT
+        year,
+        accident_count AS fatal_total,
+        CASE WHEN victim_type = '行人' THEN accident_count ELSE 0 END AS fatal_ped,
+        CASE WHEN age_group IN (%s, %s, %s) THEN accident_count ELSE 0 END AS fatal_minor
+      FROM kpi_rollup
+      WHERE year BETWEEN %s AND %s AND severity = 'fatal'
+"""
+
+_SERIES_LIVE_SOURCE = """
+      SELECT
+        year,
+        1 AS fatal_total,
+        victim_type = '行人' AS fatal_ped,
+        age_group IN (%s, %s, %s) AS fatal_minor
+      FROM accident
+      WHERE year BETWEEN %s AND %s AND severity = 'fatal'
+"""
+
+
+@cache_result("kpis", ttl=300, stale_ttl=86400, warm=True)
+@timed_query()
+async def fetch_kpi_series(year_from: int, year_to: int, baseline_year: int) -> Dict[str, Any]:
+    params = (*MINOR_AGE_GROUPS, year_from, year_to, baseline_year)
+    async with MySQLPool.acquire(readonly=True) as conn:
+        async with conn.cursor() as cur:
+            # 單次分組查詢取得所有年份，並只 join 一次 kpi_baseline
+            try:
+                await cur.execute(_SERIES_SQL.format(source=_SERIES_ROLLUP_SOURCE), params)
+            except pymysql.err.ProgrammingError:
+                await cur.execute(_SERIES_SQL.format(source=_SERIES_LIVE_SOURCE), params)
+            rows = await cur.fetchall() or []
+
+            baseline_map: Dict[str, Any] = {}
+            if not rows:
+                await cur.execute(
+                    "SELECT metric, value FROM kpi_baseline WHERE baseline_year = %s",
+                    (baseline_year,),
+                )
+                baseline_map = {m: v for (m, v) in await cur.fetchall() or []}
+
+    by_year = {int(r[0]): r for r in rows}
+    if rows:
+        baseline_map = {"fatal_total": rows[0][4], "fatal_ped": rows[0][5], "fatal_minor": rows[0][6]}
+
+    return {
+        "baseline_year": baseline_year,
+        "baseline": {k: int(baseline_map.get(k) or 0) for k in ("fatal_total", "fatal_ped", "fatal_minor")},
+        "fields": ["year", "fatal_total", "fatal_ped", "fatal_minor"],
+        "series": [
+            [
+                year,
+                int(by_year[year][1]) if year in by_year else 0,
+                int(by_year[year][2]) if year in by_year else 0,
+                int(by_year[year][3]) if year in by_year else 0,
+            ]
+            for year in range(year_from, year_to + 1)
+        ],
+    }
+
+
+@timed_query()
+async def check_kpi_rollup(year: int) -> Dict[str, Any]:
+    """Compare kpi_rollup against a live recount of the accident table"""
+    async with MySQLPool.acquire(readonly=True) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT month, severity, victim_type, age_group, accident_count
+                FROM kpi_rollup
+                WHERE year = %s
+                """,
+                (year,),
+            )
+            rollup_rows = await cur.fetchall() or []
+
+            await cur.execute(
+                """
+                SELECT
+                  month,
+                  COALESCE(severity, ''),
+                  COALESCE(victim_type, ''),
+                  COALESCE(age_group, ''),
+                  COUNT(*)
+                FROM accident
+                WHERE year = %s
+                GROUP BY month, COALESCE(severity, ''), COALESCE(victim_type, ''), COALESCE(age_group, '')
+                """,
+                (year,),
+            )
+            live_rows = await cur.fetchall() or []
+
+    rollup = {tuple(r[:4]): int(r[4]) for r in rollup_rows}
+    live = {tuple(r[:4]): int(r[4]) for r in live_rows}
+
+    mismatches: List[Dict[str, Any]] = []
+    for key in sorted(set(rollup) | set(live), key=lambda k: tuple(str(p) for p in k)):
+        if rollup.get(key, 0) != live.get(key, 0):
+            month, severity, victim_type, age_group = key
+            mismatches.append({
+                "month": month,
+                "severity": severity,
+                "victim_type": victim_type,
+                "age_group": age_group,
+                "rollup": rollup.get(key, 0),
+                "live": live.get(key, 0),
+            })
+
+    return {
+        "year": year,
+        "consistent": not mismatches,
+        "rollup_total": sum(rollup.values()),
+        "live_total": sum(live.values()),
+        "mismatches": mismatches,
+    }
+
+
+@cache_result("segments", ttl=300, stale_ttl=86400, warm=True)
+@timed_query()
 async def fetch_top_segments(county: str, year: int, limit: int, metric: str):
-    pool = await MySQLPool.create_pool()
-    async with pool.acquire() as conn:
+    async with MySQLPool.acquire(readonly=True) as conn:
         async with conn.cursor() as cur:
             await cur.execute(
                 """
@@ -91,63 +253,190 @@ async def fetch_top_segments(county: str, year: int, limit: int, metric: str):
     ]
 
 
+def _map_points_query(category: str, year: int, bbox: str = None, limit: int = 10000):
+    where_clauses = ["severity = 'fatal'", "year = %s", "lat IS NOT NULL", "lng IS NOT NULL"]
+    params = [year]
+    
+    if category != "all":
+        where_clauses.append("accident_category = %s")
+        params.append(category)
+    
+    if bbox:
+        # bbox format: "west,south,east,north"
+        try:
+            west, south, east, north = map(float, bbox.split(","))
+            where_clauses.extend([
+                "lat BETWEEN %s AND %s",
+                "lng BETWEEN %s AND %s"
+            ])
+            params.extend([south, north, west, east])
+        except ValueError:
+            pass
+    
+    where_sql = " AND ".join(where_clauses)
+    params.append(limit)
+    
+    sql = f"""
+        SELECT id, lat, lng, accident_category, victim_type, occur_dt
+        FROM accident
+        WHERE {where_sql}
+        LIMIT %s
+    """
+    return sql, params
+
+
+def map_point_feature(row) -> Dict[str, Any]:
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Point",
+            "coordinates": [float(row[2]), float(row[1])]  # lng, lat
+        },
+        "properties": {
+            "id": row[0],
+            "category": row[3],
+            "victim_type": row[4],
+            "occur_dt": row[5].isoformat() if row[5] else None
+        }
+    }
+
+
+@timed_query("map_points")
+async def _select_map_points(category: str, year: int, bbox: str = None, limit: int = 10000):
+    sql, params = _map_points_query(category, year, bbox, limit)
+    async with MySQLPool.acquire(readonly=True) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(sql, params)
+            return await cur.fetchall() or []
+
+
+def stream_map_points(category: str, year: int, bbox: str = None, limit: int = 10000):
+    """Unbuffered row iterator for streaming responses (not cached)"""
+    sql, params = _map_points_query(category, year, bbox, limit)
+    return stream_rows(sql, params)
+
+
 @cache_result("map", ttl=600)
 async def fetch_map_points(category: str, year: int, bbox: str = None, limit: int = 10000):
-    pool = await MySQLPool.create_pool()
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            where_clauses = ["severity = 'fatal'", "YEAR(occur_dt) = %s"]
-            params = [year]
-            
-            if category != "all":
-                where_clauses.append("accident_category = %s")
-                params.append(category)
-            
-            if bbox:
-                # bbox format: "west,south,east,north"
-                try:
-                    west, south, east, north = map(float, bbox.split(","))
-                    where_clauses.extend([
-                        "lat BETWEEN %s AND %s",
-                        "lng BETWEEN %s AND %s"
-                    ])
-                    params.extend([south, north, west, east])
-                except ValueError:
-                    pass
-            
-            where_sql = " AND ".join(where_clauses)
-            params.append(limit)
-            
-            await cur.execute(
-                f"""
-                SELECT id, lat, lng, accident_category, victim_type, occur_dt
-                FROM accident
-                WHERE {where_sql}
-                LIMIT %s
-                """,
-                params,
-            )
-            rows = await cur.fetchall() or []
+    rows = await _select_map_points(category, year, bbox, limit)
     
-    features = []
-    for row in rows:
-        if row[1] is not None and row[2] is not None:  # lat, lng not null
-            features.append({
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [float(row[2]), float(row[1])]  # lng, lat
-                },
-                "properties": {
-                    "id": row[0],
-                    "category": row[3],
-                    "victim_type": row[4],
-                    "occur_dt": row[5].isoformat() if row[5] else None
-                }
-            })
+    return {
+        "type": "FeatureCollection",
+        "features": [map_point_feature(row) for row in rows]
+    }
+
+
+@cache_result("map", ttl=600, as_response=True, distributed_lock=True, warm=True, warm_skip=("bbox",))
+async def fetch_map_points_response(category: str, year: int, bbox: str = None, limit: int = 10000):
+    """Full /api/map/points body, cached as encoded bytes"""
+    rows = await _select_map_points(category, year, bbox, limit)
     
     return {
         "type": "FeatureCollection",
-        "features": features
+        "features": [map_point_feature(row) for row in rows],
+        "meta": {"category": category, "year": year, "bbox": bbox, "limit": limit}
     }
 
+
+@cache_bytes_result("map", ttl=600, distributed_lock=True)
+async def fetch_map_points_binary(category: str, year: int, bbox: str = None, limit: int = 10000) -> bytes:
+    """Same rows as fetch_map_points, encoded with binary_points"""
+    rows = await _select_map_points(category, year, bbox, limit)
+    
+    return (
+        PointColumns(len(rows))
+        .int64("id", (row[0] for row in rows))
+        .float32("lng", (float(row[2]) for row in rows))
+        .float32("lat", (float(row[1]) for row in rows))
+        .dictionary("category", [row[3] for row in rows])
+        .dictionary("victim_type", [row[4] for row in rows])
+        .uint32("occur_dt", (epoch_seconds(row[5]) for row in rows))
+        .to_bytes()
+    )
+
+
+# 低於此縮放等級時，同一格網內的點合併為單一要素
+TILE_RAW_MIN_ZOOM = 12
+TILE_GRID = 256
+TILE_BUFFER = 64
+# 原始點圖磚超過此點數時改為格網合併，而不是截斷
+TILE_MAX_POINTS = 50000
+
+# 圖磚內格網座標（每磚 TILE_GRID x TILE_GRID 格），與 mvt.project 相同的 Web Mercator 投影
+_TILE_CELL_X_SQL = "FLOOR(((lng + 180) / 360 * POW(2, %s) - %s) * %s)"
+_TILE_CELL_Y_SQL = (
+    "FLOOR(((0.5 - LN((1 + SIN(RADIANS(lat))) / (1 - SIN(RADIANS(lat)))) / (4 * PI()))"
+    " * POW(2, %s) - %s) * %s)"
+)
+
+
+async def fetch_map_tile(category: str, year: int, z: int, x: int, y: int) -> bytes:
+    """Encode the fatal accidents inside one web-mercator tile as MVT"""
+    # 資料版本放進參數，ETL 後的新圖磚自然換 key
+    return await _encode_map_tile(category, year, z, x, y, await get_data_version())
+
+
+@cache_bytes_result("map", ttl=3600, distributed_lock=True)
+@timed_query("map_tile")
+async def _encode_map_tile(category: str, year: int, z: int, x: int, y: int, version: int) -> bytes:
+    west, south, east, north = mvt.tile_bounds(z, x, y)
+    pad_x = (east - west) * TILE_BUFFER / mvt.EXTENT
+    pad_y = (north - south) * TILE_BUFFER / mvt.EXTENT
+
+    where_clauses = [
+        "severity = 'fatal'",
+        "year = %s",
+        "lat BETWEEN %s AND %s",
+        "lng BETWEEN %s AND %s",
+    ]
+    params: List[Any] = [year, south - pad_y, north + pad_y, west - pad_x, east + pad_x]
+    if category != "all":
+        where_clauses.append("accident_category = %s")
+        params.append(category)
+    where_sql = " AND ".join(where_clauses)
+
+    features: List[Dict[str, Any]] = []
+    async with MySQLPool.acquire(readonly=True) as conn:
+        async with conn.cursor() as cur:
+            rows: List[Any] = []
+            if z >= TILE_RAW_MIN_ZOOM:
+                await cur.execute(
+                    f"""
+                    SELECT id, lat, lng, accident_category, victim_type, occur_dt
+                    FROM accident
+                    WHERE {where_sql}
+                    LIMIT %s
+                    """,
+                    (*params, TILE_MAX_POINTS + 1),
+                )
+                rows = await cur.fetchall() or []
+
+            if z >= TILE_RAW_MIN_ZOOM and len(rows) <= TILE_MAX_POINTS:
+                for row in rows:
+                    features.append({
+                        "id": row[0],
+                        "xy": mvt.project(float(row[2]), float(row[1]), z, x, y),
+                        "properties": {
+                            "category": row[3],
+                            "victim_type": row[4],
+                            "occur_dt": row[5].isoformat() if row[5] else None,
+                        },
+                    })
+            else:
+                # 依縮放等級簡化：在 SQL 內依格網合併，輸出重心與數量（每磚最多約 TILE_GRID² 列，不會截斷）
+                await cur.execute(
+                    f"""
+                    SELECT COUNT(*), AVG(lat), AVG(lng)
+                    FROM accident
+                    WHERE {where_sql}
+                    GROUP BY {_TILE_CELL_X_SQL}, {_TILE_CELL_Y_SQL}
+                    """,
+                    (*params, z, x, TILE_GRID, z, y, TILE_GRID),
+                )
+                for count, lat, lng in await cur.fetchall() or []:
+                    features.append({
+                        "xy": mvt.project(float(lng), float(lat), z, x, y),
+                        "properties": {"point_count": int(count)},
+                    })
+
+    return mvt.encode_point_layer("accidents", features)
@@ -0,0 +1,74 @@
+import asyncio
+import re
+from typing import Any, Optional
+from fastapi import APIRouter
+from ..cache import prefetch
+from ..queries import fetch_kpis, fetch_top_segments
+from .cms_content import fetch_dangerous_segments, fetch_homepage_settings, fetch_kpi_configs, fetch_kpi_data
+from .kpis import resolve_kpis
+from .segments import resolve_top_segments
+
+
+router = APIRouter()
+
+HOMEPAGE_SEGMENT_LIMIT = 5
+
+
+def _year_from(value: Any, default: int) -> int:
+    # 與前端相同：從 "2025年" 這類字串取出四位數年份
+    match = re.search(r"(\d{4})", str(value or ""))
+    return int(match.group(1)) if match else default
+
+
+def _section(name: str, result: Any, empty: Any) -> Any:
+    if isinstance(result, Exception):
+        print(f"Homepage bundle: {name} unavailable: {result!r}")
+        return empty
+    return result
+
+
+@router.get("/bundle/homepage")
+async def get_homepage_bundle(year: Optional[int] = None, baseline_year: Optional[int] = None):
+    """首頁所需資料一次取得：CMS 設定、KPI 設定、KPI 與危險路段"""
+    settings = None
+    if year is None or baseline_year is None:
+        # 未指定年份時依首頁設定決定
+        try:
+            settings = await fetch_homepage_settings()
+        except Exception as e:
+            settings = _section("settings", e, {})
+        year = year or _year_from(settings.get("kpi_section_year"), 2024)
+        baseline_year = baseline_year or _year_from(settings.get("baseline_year"), 2020)
+
+    segment_args = {"county": "ALL", "year": year, "limit": HOMEPAGE_SEGMENT_LIMIT}
+    # 一次 pipeline 把所有快取項目載入 L1，之後的呼叫不再個別往返 Redis
+    await prefetch(
+        (fetch_homepage_settings, (), {}),
+        (fetch_kpi_configs, (), {}),
+        (fetch_kpi_data, (year,), {}),
+        (fetch_kpis, (), {"year": year, "baseline_year": baseline_year}),
+        (fetch_dangerous_segments, (), segment_args),
+        (fetch_top_segments, (), {**segment_args, "metric": "fatal_count"}),
+    )
+
+    settings, kpi_configs, kpis, segments = await asyncio.gather(
+        fetch_homepage_settings(),
+        fetch_kpi_configs(),
+        resolve_kpis(year, baseline_year),
+        resolve_top_segments("ALL", year, HOMEPAGE_SEGMENT_LIMIT, "fatal_count"),
+        return_exceptions=True,
+    )
+    # 各區塊獨立降級：單一來源失敗只清空該區塊，不讓整包回傳 500
+    settings = _section("settings", settings, {})
+    kpi_configs = _section("kpi_configs", kpi_configs, {})
+    metrics, kpi_source = _section("kpis", kpis, ({}, "unavailable"))
+    items, segment_source = _section("segments", segments, ([], "unavailable"))
+
+    return {
+        "year": year,
+        "baseline_year": baseline_year,
+        "settings": settings,
+        "kpi_configs": kpi_configs,
+        "kpis": {"metrics": metrics, "data_source": kpi_source},
+        "segments": {"items": items, "data_source": segment_source},
+    }
@@ -1,39 +1,46 @@
-from fastapi import APIRouter, HTTPException
-import aiohttp
+import hashlib
+import hmac
 import os
-from ..cache import cache_result
+import orjson
+from fastapi import APIRouter, HTTPException, Request
+from ..cache import Fallback, cache_result, invalidate_cache_group, invalidate_cache_key
+from ..cms_client import CMSClient
 
 router = APIRouter()
 
-# CMS設定
-CMS_BASE_URL = os.getenv("CMS_BASE_URL", "http://cms:1337")
+# CMS 內容很少變動，由 /api/cms/webhook 主動失效，因此可以快取很久（秒）；
+# 未設定 CMS_WEBHOOK_SECRET 時 Webhook 一律拒絕，沒有主動失效，只能維持短快取
+CMS_CACHE_TTL = (
+    int(os.getenv("CMS_CACHE_TTL", "21600")) if os.getenv("CMS_WEBHOOK_SECRET") else 10
+)
+# CMS 無法連線時的預設值只快取這麼久（秒），恢復後很快就會改用真實內容
+CMS_FALLBACK_TTL = 30
 
-@cache_result("homepage_settings", ttl=10)
+@cache_result("homepage_settings", ttl=CMS_CACHE_TTL, negative_ttl=CMS_FALLBACK_TTL)
 async def fetch_homepage_settings():
     """從CMS獲取首頁設定"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{CMS_BASE_URL}/homepage-setting") as response:
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 404:
-                    # 如果沒有設定資料，返回預設值
-                    return {
-                        "page_title": "交通安全總覽",
-                        "page_subtitle": "即時交通事故數據與分析，促進道路安全改善",
-                        "kpi_section_title": "關鍵指標",
-                        "kpi_section_year": "2024年",
-                        "dangerous_roads_title": "最危險路段",
-                        "dangerous_roads_link_text": "查看完整報告 →",
-                        "dangerous_roads_custom_content": "",
-                        "map_section_title": "事故分布地圖",
-                        "map_section_link_text": "開啟完整地圖 →"
-                    }
-                else:
-                    raise HTTPException(status_code=response.status, detail="Failed to fetch homepage settings")
+        status, data = await CMSClient.get_json("/homepage-setting")
+        if status == 200:
+            return data
+        elif status == 404:
+            # 如果沒有設定資料，返回預設值
+            return {
+                "page_title": "交通安全總覽",
+                "page_subtitle": "即時交通事故數據與分析，促進道路安全改善",
+                "kpi_section_title": "關鍵指標",
+                "kpi_section_year": "2024年",
+                "dangerous_roads_title": "最危險路段",
+                "dangerous_roads_link_text": "查看完整報告 →",
+                "dangerous_roads_custom_content": "",
+                "map_section_title": "事故分布地圖",
+                "map_section_link_text": "開啟完整地圖 →"
+            }
+        else:
+            raise HTTPException(status_code=status, detail="Failed to fetch homepage settings")
     except Exception as e:
         # 發生錯誤時返回預設值
-        return {
+        return Fallback({
             "page_title": "交通安全總覽",
             "page_subtitle": "即時交通事故數據與分析，促進道路安全改善",
             "kpi_section_title": "關鍵指標",
@@ -43,36 +50,35 @@ async def fetch_homepage_settings():
             "dangerous_roads_custom_content": "",
             "map_section_title": "事故分布地圖",
             "map_section_link_text": "開啟完整地圖 →"
-        }
+        })
 
-@cache_result("dashboard_settings", ttl=10)
+@cache_result("dashboard_settings", ttl=CMS_CACHE_TTL, negative_ttl=CMS_FALLBACK_TTL)
 async def fetch_dashboard_settings():
     """從CMS獲取儀表板設定"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{CMS_BASE_URL}/dashboard-setting") as response:
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 404:
-                    # 如果沒有設定資料，返回預設值
-                    return {
-                        "page_title": "詳細儀表板",
-                        "page_subtitle": "深度分析交通事故數據與趨勢",
-                        "quick_actions_title": "快速行動",
-                        "kpi_overview_title": "關鍵指標概覽",
-                        "pedestrian_section_title": "行人事故分析",
-                        "dangerous_roads_title": "最危險路段",
-                        "cause_analysis_title": "主要肇因分析",
-                        "baseline_year_label": "vs 基準年",
-                        "upload_data_text": "📤 上傳數據",
-                        "view_map_text": "🗺️ 查看地圖",
-                        "pedestrian_map_text": "🚶 行人地圖"
-                    }
-                else:
-                    raise HTTPException(status_code=response.status, detail="Failed to fetch dashboard settings")
+        status, data = await CMSClient.get_json("/dashboard-setting")
+        if status == 200:
+            return data
+        elif status == 404:
+            # 如果沒有設定資料，返回預設值
+            return {
+                "page_title": "詳細儀表板",
+                "page_subtitle": "深度分析交通事故數據與趨勢",
+                "quick_actions_title": "快速行動",
+                "kpi_overview_title": "關鍵指標概覽",
+                "pedestrian_section_title": "行人事故分析",
+                "dangerous_roads_title": "最危險路段",
+                "cause_analysis_title": "主要肇因分析",
+                "baseline_year_label": "vs 基準年",
+                "upload_data_text": "📤 上傳數據",
+                "view_map_text": "🗺️ 查看地圖",
+                "pedestrian_map_text": "🚶 行人地圖"
+            }
+        else:
+            raise HTTPException(status_code=status, detail="Failed to fetch dashboard settings")
     except Exception as e:
         # 發生錯誤時返回預設值
-        return {
+        return Fallback({
             "page_title": "詳細儀表板",
             "page_subtitle": "深度分析交通事故數據與趨勢",
             "quick_actions_title": "快速行動",
@@ -84,54 +90,52 @@ async def fetch_dashboard_settings():
             "upload_data_text": "📤 上傳數據",
             "view_map_text": "🗺️ 查看地圖",
             "pedestrian_map_text": "🚶 行人地圖"
-        }
+        })
 
-@cache_result("kpi_configs", ttl=10)
+@cache_result("kpi_configs", ttl=CMS_CACHE_TTL, negative_ttl=CMS_FALLBACK_TTL)
 async def fetch_kpi_configs():
     """從CMS獲取KPI設定"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{CMS_BASE_URL}/kpi-configs") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # 轉換為以key為索引的字典格式
-                    configs = {}
-                    for item in data:
-                        configs[item['key']] = item
-                    return configs
-                elif response.status == 404:
-                    # 如果沒有設定資料，返回預設值
-                    return {
-                        "fatal_total": {
-                            "key": "fatal_total",
-                            "label": "總死亡人數",
-                            "icon": "🚨",
-                            "display_order": 1,
-                            "unit": "人",
-                            "color_scheme": "danger"
-                        },
-                        "fatal_ped": {
-                            "key": "fatal_ped",
-                            "label": "行人死亡人數",
-                            "icon": "🚶",
-                            "display_order": 2,
-                            "unit": "人",
-                            "color_scheme": "danger"
-                        },
-                        "fatal_minor": {
-                            "key": "fatal_minor",
-                            "label": "兒少死亡人數",
-                            "icon": "👶",
-                            "display_order": 3,
-                            "unit": "人",
-                            "color_scheme": "danger"
-                        }
-                    }
-                else:
-                    raise HTTPException(status_code=response.status, detail="Failed to fetch KPI configs")
+        status, data = await CMSClient.get_json("/kpi-configs")
+        if status == 200:
+            # 轉換為以key為索引的字典格式
+            configs = {}
+            for item in data:
+                configs[item['key']] = item
+            return configs
+        elif status == 404:
+            # 如果沒有設定資料，返回預設值
+            return {
+                "fatal_total": {
+                    "key": "fatal_total",
+                    "label": "總死亡人數",
+                    "icon": "🚨",
+                    "display_order": 1,
+                    "unit": "人",
+                    "color_scheme": "danger"
+                },
+                "fatal_ped": {
+                    "key": "fatal_ped",
+                    "label": "行人死亡人數",
+                    "icon": "🚶",
+                    "display_order": 2,
+                    "unit": "人",
+                    "color_scheme": "danger"
+                },
+                "fatal_minor": {
+                    "key": "fatal_minor",
+                    "label": "兒少死亡人數",
+                    "icon": "👶",
+                    "display_order": 3,
+                    "unit": "人",
+                    "color_scheme": "danger"
+                }
+            }
+        else:
+            raise HTTPException(status_code=status, detail="Failed to fetch KPI configs")
     except Exception as e:
         # 發生錯誤時返回預設值
-        return {
+        return Fallback({
             "fatal_total": {
                 "key": "fatal_total",
                 "label": "總死亡人數",
@@ -156,76 +160,72 @@ async def fetch_kpi_configs():
                 "unit": "人",
                 "color_scheme": "danger"
             }
-        }
+        })
 
-@cache_result("kpi_data", ttl=10)
+@cache_result("kpi_data", ttl=CMS_CACHE_TTL, negative_ttl=CMS_FALLBACK_TTL)
 async def fetch_kpi_data(year: int = 2024):
     """從CMS獲取KPI數據值"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{CMS_BASE_URL}/kpi-data?year={year}&is_active=true") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # 轉換為以key為索引的字典格式
-                    kpi_data = {}
-                    for item in data:
-                        kpi_data[item['key']] = {
-                            "current": int(item['current_value']),
-                            "baseline": int(item['baseline_value']),
-                            "pct_change": float(item.get('pct_change', 0)),
-                            "year": int(item['year']),
-                            "baseline_year": int(item['baseline_year']),
-                            "notes": item.get('notes', ''),
-                            "data_source": item.get('data_source', 'manual')
-                        }
-                    return kpi_data
-                else:
-                    # 如果CMS中沒有數據，返回空字典（將使用資料庫計算）
-                    return {}
+        status, data = await CMSClient.get_json(f"/kpi-data?year={year}&is_active=true")
+        if status == 200:
+            # 轉換為以key為索引的字典格式
+            kpi_data = {}
+            for item in data:
+                kpi_data[item['key']] = {
+                    "current": int(item['current_value']),
+                    "baseline": int(item['baseline_value']),
+                    "pct_change": float(item.get('pct_change', 0)),
+                    "year": int(item['year']),
+                    "baseline_year": int(item['baseline_year']),
+                    "notes": item.get('notes', ''),
+                    "data_source": item.get('data_source', 'manual')
+                }
+            return kpi_data
+        else:
+            # 如果CMS中沒有數據，返回空字典（將使用資料庫計算）
+            return {}
     except Exception as e:
         # 發生錯誤時返回空字典（將使用資料庫計算）
-        return {}
+        return Fallback({})
 
-@cache_result("dangerous_segments", ttl=10)
+@cache_result("dangerous_segments", ttl=CMS_CACHE_TTL, negative_ttl=CMS_FALLBACK_TTL)
 async def fetch_dangerous_segments(year: int = 2024, county: str = "ALL", limit: int = 10):
     """從CMS獲取危險路段數據"""
     try:
-        async with aiohttp.ClientSession() as session:
-            # 構建查詢參數
-            params = f"year={year}&is_active=true&_sort=display_order:ASC"
-            if county != "ALL":
-                params += f"&county={county}"
-            if limit:
-                params += f"&_limit={limit}"
-                
-            async with session.get(f"{CMS_BASE_URL}/dangerous-segments?{params}") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # 轉換為前端期望的格式
-                    segments = []
-                    for item in data:
-                        segments.append({
-                            "road_segment_id": item.get('segment_id', ''),
-                            "segment_name": item.get('segment_name', ''),
-                            "county": item.get('county', ''),
-                            "fatal_count": int(item.get('fatal_count', 0)),
-                            "accident_count": int(item.get('accident_count', 0)),
-                            "injury_count": int(item.get('injury_count', 0)),
-                            "risk_level": item.get('risk_level', 'high'),
-                            "status_label": item.get('status_label', '高風險'),
-                            "display_order": int(item.get('display_order', 0)),
-                            "notes": item.get('notes', ''),
-                            "data_source": item.get('data_source', 'manual'),
-                            "latitude": item.get('latitude'),
-                            "longitude": item.get('longitude')
-                        })
-                    return segments
-                else:
-                    # 如果CMS中沒有數據，返回空列表（將使用資料庫計算）
-                    return []
+        # 構建查詢參數
+        params = f"year={year}&is_active=true&_sort=display_order:ASC"
+        if county != "ALL":
+            params += f"&county={county}"
+        if limit:
+            params += f"&_limit={limit}"
+            
+        status, data = await CMSClient.get_json(f"/dangerous-segments?{params}")
+        if status == 200:
+            # 轉換為前端期望的格式
+            segments = []
+            for item in data:
+                segments.append({
+                    "road_segment_id": item.get('segment_id', ''),
+                    "segment_name": item.get('segment_name', ''),
+                    "county": item.get('county', ''),
+                    "fatal_count": int(item.get('fatal_count', 0)),
+                    "accident_count": int(item.get('accident_count', 0)),
+                    "injury_count": int(item.get('injury_count', 0)),
+                    "risk_level": item.get('risk_level', 'high'),
+                    "status_label": item.get('status_label', '高風險'),
+                    "display_order": int(item.get('display_order', 0)),
+                    "notes": item.get('notes', ''),
+                    "data_source": item.get('data_source', 'manual'),
+                    "latitude": item.get('latitude'),
+                    "longitude": item.get('longitude')
+                })
+            return segments
+        else:
+            # 如果CMS中沒有數據，返回空列表（將使用資料庫計算）
+            return []
     except Exception as e:
         # 發生錯誤時返回空列表（將使用資料庫計算）
-        return []
+        return Fallback([])
 
 @router.get("/cms/homepage-settings")
 async def get_homepage_settings():
@@ -256,3 +256,73 @@ async def get_dangerous_segments(year: int = 2024, county: str = "ALL", limit: i
     """獲取危險路段數據"""
     segments = await fetch_dangerous_segments(year, county, limit)
     return {"data": segments, "year": year, "county": county, "limit": limit}
+
+def _verify_webhook(request: Request, body: bytes) -> None:
+    """Accept an HMAC-SHA256 body signature or the shared secret as a bearer token"""
+    secret = os.getenv("CMS_WEBHOOK_SECRET")
+    if not secret:
+        # 未設定密鑰時不接受任何呼叫，避免任何人都能清除快取
+        raise HTTPException(status_code=401, detail="webhook secret not configured")
+    
+    signature = request.headers.get("x-webhook-signature", "")
+    if signature:
+        expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        if hmac.compare_digest(signature.encode(), expected.encode()):
+            return
+    # Strapi 3 的 Webhook 只能設定固定標頭：Authorization: Bearer <secret>
+    authorization = request.headers.get("authorization", "")
+    if hmac.compare_digest(authorization.encode(), f"Bearer {secret}".encode()):
+        return
+    raise HTTPException(status_code=401, detail="invalid signature")
+
+
+@router.post("/cms/webhook")
+async def cms_webhook(request: Request):
+    """Strapi 發布／更新／刪除內容時呼叫，只失效受影響的快取"""
+    body = await request.body()
+    _verify_webhook(request, body)
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="invalid JSON")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="payload must be an object")
+    
+    event = payload.get("event", "")
+    model = payload.get("model", "")
+    entry = payload.get("entry")
+    if not isinstance(entry, dict):
+        entry = {}
+    invalidated = []
+    
+    if model == "homepage-setting":
+        invalidated += await invalidate_cache_key(fetch_homepage_settings)
+    elif model == "dashboard-setting":
+        invalidated += await invalidate_cache_key(fetch_dashboard_settings)
+    elif model == "kpi-config":
+        invalidated += await invalidate_cache_key(fetch_kpi_configs)
+    elif model == "kpi-data":
+        # 更新時年份可能被改掉，舊年份的快取也要清，所以整組失效
+        year = None
+        if event != "entry.update":
+            try:
+                year = int(entry.get("year"))
+            except (TypeError, ValueError, OverflowError):
+                year = None
+        if year:
+            invalidated += await invalidate_cache_key(fetch_kpi_data, year)
+        else:
+            await invalidate_cache_group("kpi_data")
+            invalidated.append("kpi_data")
+    elif model == "dangerous-segment":
+        # 鍵包含縣市與筆數，無法逐一推算
+        await invalidate_cache_group("dangerous_segments")
+        invalidated.append("dangerous_segments")
+    
+    return {"event": event, "model": model, "invalidated": invalidated}
+
+
+@router.get("/cms/status")
+async def get_cms_status():
+    """CMS 熔斷器狀態"""
+    return {"breaker": CMSClient.breaker_state()}
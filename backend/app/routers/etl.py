@@ -6,7 +6,9 @@ from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from redis import Redis
 from rq import Queue
 from pydantic import BaseModel
-from ..cache import invalidate_cache_group
+from ..db import MySQLPool
+from ..cache import get_cache_stats, invalidate_cache_group, warm_cache_groups
+from ..clustering import rebuild_accident_clusters
 
 router = APIRouter()
 
@@ -103,17 +105,18 @@ async def etl_rollback(run_id: str):
     # 4. Clearing caches
     
     # For now, just clear caches as a basic rollback
-    cleared_kpis = invalidate_cache_group("kpis")
-    cleared_segments = invalidate_cache_group("segments") 
-    cleared_map = invalidate_cache_group("map")
+    # 快取以世代失效，回傳各群組新的世代編號
+    kpis_generation = await invalidate_cache_group("kpis")
+    segments_generation = await invalidate_cache_group("segments") 
+    map_generation = await invalidate_cache_group("map")
     
     return {
         "ok": True,
         "run_id": run_id,
-        "cache_cleared": {
-            "kpis": cleared_kpis,
-            "segments": cleared_segments,
-            "map": cleared_map
+        "cache_generation": {
+            "kpis": kpis_generation,
+            "segments": segments_generation,
+            "map": map_generation
         },
         "message": "Cache cleared, full rollback not yet implemented"
     }
@@ -181,17 +184,46 @@ async def etl_upload(
 async def clear_etl_cache(cache_group: str = "all"):
     """Clear ETL-related caches"""
     if cache_group == "all":
-        cleared_kpis = invalidate_cache_group("kpis")
-        cleared_segments = invalidate_cache_group("segments")
-        cleared_map = invalidate_cache_group("map")
+        kpis_generation = await invalidate_cache_group("kpis")
+        segments_generation = await invalidate_cache_group("segments")
+        map_generation = await invalidate_cache_group("map")
         return {
-            "cleared": {
-                "kpis": cleared_kpis,
-                "segments": cleared_segments,
-                "map": cleared_map
+            "generation": {
+                "kpis": kpis_generation,
+                "segments": segments_generation,
+                "map": map_generation
             }
         }
     else:
-        cleared = invalidate_cache_group(cache_group)
-        return {"cleared": {cache_group: cleared}}
+        generation = await invalidate_cache_group(cache_group)
+        return {"generation": {cache_group: generation}}
 
+
+@router.post("/etl/cache/warm")
+async def warm_etl_cache(secret: str | None = None, groups: str = "kpis,segments,map", top: int = 20):
+    """Precompute the most requested keys after an ETL run, then swap them in"""
+    expected = os.getenv("ETL_SECRET")
+    if expected and secret != expected:
+        raise HTTPException(status_code=401, detail="invalid secret")
+    
+    group_list = [g.strip() for g in groups.split(",") if g.strip()]
+    # 剛寫入的資料可能還沒複寫到唯讀庫，暖快取一律讀主庫
+    with MySQLPool.primary_reads():
+        return {"warmed": await warm_cache_groups(group_list, top_n=top)}
+
+
+@router.post("/etl/clusters/rebuild")
+async def rebuild_etl_clusters(year: int, secret: str | None = None):
+    """Rebuild the fatal-accident map cluster grid of a year after an ETL run"""
+    expected = os.getenv("ETL_SECRET")
+    if expected and secret != expected:
+        raise HTTPException(status_code=401, detail="invalid secret")
+    
+    await rebuild_accident_clusters(year)
+    return {"rebuilt": {"source": "accident", "year": year}}
+
+
+@router.get("/etl/cache/stats")
+async def etl_cache_stats():
+    """Per-group cache hit ratios for this process"""
+    return get_cache_stats()
@@ -1,11 +1,32 @@
-from fastapi import APIRouter, Query
-from ..queries import fetch_kpis
+import asyncio
+import os
+from typing import Any, Dict, Tuple
+from fastapi import APIRouter, HTTPException, Query
+from ..queries import fetch_kpis, fetch_kpi_series, check_kpi_rollup
 from .cms_content import fetch_kpi_data
 
 
 router = APIRouter()
 
 
+async def resolve_kpis(year: int, baseline_year: int) -> Tuple[Dict[str, Any], str]:
+    """CMS KPI values when present, otherwise computed from the database.
+
+    Both lookups run concurrently; a database error only matters when the
+    CMS has nothing for the year.
+    """
+    cms_kpi_data, db_kpis = await asyncio.gather(
+        fetch_kpi_data(year),
+        fetch_kpis(year=year, baseline_year=baseline_year),
+        return_exceptions=True,
+    )
+    if isinstance(cms_kpi_data, dict) and cms_kpi_data:
+        return cms_kpi_data, "cms"
+    if isinstance(db_kpis, BaseException):
+        raise db_kpis
+    return db_kpis, "database"
+
+
 @router.get("/kpis")
 async def get_kpis(baseline_year: int = 2020, period: str = Query("year:2024")):
     # period 解析（簡化: year:YYYY）
@@ -16,15 +37,32 @@ async def get_kpis(baseline_year: int = 2020, period: str = Query("year:2024")):
         except Exception:
             year = 2024
     
-    # 優先從CMS獲取KPI數據
-    cms_kpi_data = await fetch_kpi_data(year)
-    
-    if cms_kpi_data:
-        # 使用CMS中的數據
-        metrics = cms_kpi_data
-    else:
-        # 如果CMS中沒有數據，從資料庫計算
-        metrics = await fetch_kpis(year=year, baseline_year=baseline_year)
+    # 優先使用CMS中的KPI數據，沒有時改用資料庫計算
+    metrics, data_source = await resolve_kpis(year, baseline_year)
     
-    return {"period": period, "baseline_year": baseline_year, "metrics": metrics, "data_source": "cms" if cms_kpi_data else "database"}
+    return {"period": period, "baseline_year": baseline_year, "metrics": metrics, "data_source": data_source}
+
+
+@router.get("/kpis/series")
+async def get_kpi_series(
+    year_from: int = Query(2018, alias="from"),
+    year_to: int = Query(2025, alias="to"),
+    baseline_year: int = 2020,
+):
+    # 一次回傳多年度 KPI，取代逐年呼叫 /api/kpis
+    if year_from > year_to:
+        raise HTTPException(status_code=400, detail="from must be <= to")
+    if year_to - year_from > 50:
+        raise HTTPException(status_code=400, detail="year range too large")
+
+    series = await fetch_kpi_series(year_from=year_from, year_to=year_to, baseline_year=baseline_year)
+    return {"from": year_from, "to": year_to, **series}
+
 
+@router.get("/kpis/rollup/check")
+async def get_kpi_rollup_check(year: int = 2024, secret: str | None = None):
+    # 比對 kpi_rollup 彙總表與 accident 即時計數（整年重新計數，僅限持有 ETL 密鑰者）
+    expected = os.getenv("ETL_SECRET")
+    if expected and secret != expected:
+        raise HTTPException(status_code=401, detail="invalid secret")
+    return await check_kpi_rollup(year)
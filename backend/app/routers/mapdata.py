@@ -1,5 +1,17 @@
-from fastapi import APIRouter, Query
-from ..queries import fetch_map_points
+from fastapi import APIRouter, HTTPException, Query, Response
+from ..queries import (
+    fetch_map_points,
+    fetch_map_points_binary,
+    fetch_map_points_response,
+    fetch_map_tile,
+    map_point_feature,
+    stream_map_points,
+)
+from ..streaming import GEOJSON_MEDIA_TYPE, NDJSON_MEDIA_TYPE, geojson_stream, ndjson_stream
+from ..binary_points import MEDIA_TYPE as BINARY_POINTS_MEDIA_TYPE
+from ..timing import TimedStreamingResponse
+from ..clustering import MAX_CLUSTER_ZOOM, RAW_POINT_LIMIT, fetch_clusters, parse_bbox
+from .pedestrian import fetch_pedestrian_map_points
 
 
 router = APIRouter()
@@ -10,9 +22,70 @@ async def map_points(
     category: str = "all", 
     year: int = 2024, 
     bbox: str | None = None,
-    limit: int = Query(10000, le=50000)
+    limit: int = Query(10000, le=50000),
+    format: str = Query("geojson", pattern="^(geojson|binary|ndjson)$"),
+    stream: bool = False
 ):
-    geojson = await fetch_map_points(category=category, year=year, bbox=bbox, limit=limit)
-    geojson["meta"] = {"category": category, "year": year, "bbox": bbox, "limit": limit}
-    return geojson
+    meta = {"category": category, "year": year, "bbox": bbox, "limit": limit}
 
+    if format == "binary":
+        content = await fetch_map_points_binary(category=category, year=year, bbox=bbox, limit=limit)
+        return Response(content=content, media_type=BINARY_POINTS_MEDIA_TYPE)
+
+    # 串流模式：伺服器端游標逐批輸出，不經快取
+    if format == "ndjson":
+        batches = stream_map_points(category=category, year=year, bbox=bbox, limit=limit)
+        return TimedStreamingResponse(ndjson_stream(batches, map_point_feature), media_type=NDJSON_MEDIA_TYPE)
+    if stream:
+        batches = stream_map_points(category=category, year=year, bbox=bbox, limit=limit)
+        return TimedStreamingResponse(geojson_stream(batches, map_point_feature, meta), media_type=GEOJSON_MEDIA_TYPE)
+
+    return await fetch_map_points_response(category=category, year=year, bbox=bbox, limit=limit)
+
+
+@router.get("/map/tiles/{z}/{x}/{y}.mvt")
+async def map_tile(z: int, x: int, y: int, category: str = "all", year: int = 2024):
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="invalid tile coordinates")
+
+    tile = await fetch_map_tile(category=category, year=year, z=z, x=x, y=y)
+    return Response(
+        content=tile,
+        media_type="application/vnd.mapbox-vector-tile",
+        headers={"Cache-Control": "public, max-age=600"},
+    )
+
+
+@router.get("/map/clusters")
+async def map_clusters(
+    bbox: str,
+    zoom: int = Query(..., ge=0, le=22),
+    source: str = Query("accident", pattern="^(accident|pedestrian)$"),
+    category: str = "all",
+    year: int | None = None,
+):
+    bounds = parse_bbox(bbox)
+    if bounds is None:
+        raise HTTPException(status_code=400, detail="bbox must be west,south,east,north")
+    if source == "accident" and year is None:
+        year = 2024
+
+    meta = {"source": source, "category": category, "year": year, "bbox": bbox, "zoom": zoom}
+
+    # 高縮放等級直接回傳原始點位
+    if zoom > MAX_CLUSTER_ZOOM:
+        if source == "pedestrian":
+            geojson = await fetch_pedestrian_map_points(
+                year=year, accident_type=category, limit=RAW_POINT_LIMIT, bbox=bbox
+            )
+        else:
+            geojson = await fetch_map_points(category=category, year=year, bbox=bbox, limit=RAW_POINT_LIMIT)
+        geojson["meta"] = {**meta, "clustered": False}
+        return geojson
+
+    features = await fetch_clusters(source=source, zoom=zoom, bbox=bounds, year=year, category=category)
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+        "meta": {**meta, "clustered": True},
+    }
@@ -1,16 +1,20 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Query
+from fastapi import APIRouter, HTTPException, UploadFile, File, Query, Response
 from typing import Optional
 import pandas as pd
 import io
 from ..db import MySQLPool
-from ..cache import cache_result, invalidate_cache_group
+from ..metrics import timed_query
+from ..cache import cache_bytes_result, cache_result, invalidate_cache_group
+from ..binary_points import MEDIA_TYPE as BINARY_POINTS_MEDIA_TYPE, PointColumns, epoch_seconds
+from ..clustering import parse_bbox, rebuild_pedestrian_clusters
+from ..streaming import GEOJSON_MEDIA_TYPE, NDJSON_MEDIA_TYPE, geojson_stream, ndjson_stream, stream_rows
+from ..timing import TimedStreamingResponse
 
 router = APIRouter()
 
 async def create_pedestrian_table():
     """創建行人事故資料表"""
-    pool = await MySQLPool.create_pool()
-    async with pool.acquire() as conn:
+    async with MySQLPool.acquire() as conn:
         async with conn.cursor() as cur:
             # 創建主表格
             await cur.execute("""
@@ -79,7 +83,6 @@ async def upload_pedestrian_csv(file: UploadFile = File(...)):
         await create_pedestrian_table()
         
         # 資料處理和插入
-        pool = await MySQLPool.create_pool()
         inserted_count = 0
         error_rows = []
         
@@ -93,7 +96,7 @@ async def upload_pedestrian_csv(file: UploadFile = File(...)):
             '承辦警局': 'Unknown'
         })
         
-        async with pool.acquire() as conn:
+        async with MySQLPool.acquire() as conn:
             async with conn.cursor() as cur:
                 for index, row in df.iterrows():
                     try:
@@ -182,8 +185,12 @@ async def upload_pedestrian_csv(file: UploadFile = File(...)):
                     except Exception as e:
                         error_rows.append({"row": index + 1, "error": str(e)})
         
-        # 清除相關快取
-        invalidate_cache_group("pedestrian")
+        # 重建群聚索引並清除相關快取
+        try:
+            await rebuild_pedestrian_clusters()
+        except Exception as e:
+            print(f"Rebuild pedestrian clusters error: {e}")
+        await invalidate_cache_group("pedestrian")
         
         return {
             "status": "success",
@@ -197,14 +204,14 @@ async def upload_pedestrian_csv(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"處理檔案時發生錯誤: {str(e)}") from e
 
 @router.get("/pedestrian/stats")
+@timed_query()
 async def get_pedestrian_stats():
     """取得行人事故統計資料"""
     try:
         # 確保資料表存在
         await create_pedestrian_table()
         
-        pool = await MySQLPool.create_pool()
-        async with pool.acquire() as conn:
+        async with MySQLPool.acquire(readonly=True) as conn:
             async with conn.cursor() as cur:
                 # 檢查表是否存在且有資料
                 await cur.execute("SHOW TABLES LIKE 'pedestrian_accidents'")
@@ -293,83 +300,145 @@ async def get_pedestrian_stats():
             "error": str(e)
         }
 
-@cache_result("pedestrian", ttl=300)
-async def fetch_pedestrian_map_points(year: Optional[int] = None, accident_type: str = "all", limit: int = 10000):
-    """取得行人事故地圖點位資料"""
-    pool = await MySQLPool.create_pool()
-    async with pool.acquire() as conn:
+def _pedestrian_map_points_query(year: Optional[int] = None, accident_type: str = "all", limit: int = 10000, bbox: str = None):
+    where_clauses = []
+    params = []
+    
+    if year:
+        where_clauses.append("YEAR(occur_datetime) = %s")
+        params.append(year)
+    
+    if accident_type != "all":
+        where_clauses.append("accident_type = %s")
+        params.append(accident_type)
+    
+    bounds = parse_bbox(bbox)
+    if bounds:
+        west, south, east, north = bounds
+        where_clauses.extend([
+            "latitude BETWEEN %s AND %s",
+            "longitude BETWEEN %s AND %s"
+        ])
+        params.extend([south, north, west, east])
+    
+    where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+    params.append(limit)
+    
+    sql = f"""
+        SELECT id, latitude, longitude, accident_type, occur_datetime,
+               death_count, injury_count, vehicle_main_type, vehicle_sub_type,
+               pedestrian_gender, pedestrian_age, location, police_station
+        FROM pedestrian_accidents
+        WHERE {where_sql}
+        ORDER BY occur_datetime DESC
+        LIMIT %s
+    """
+    return sql, params
+
+def pedestrian_point_feature(row):
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Point",
+            "coordinates": [float(row[2]), float(row[1])]  # lng, lat
+        },
+        "properties": {
+            "id": row[0],
+            "accident_type": row[3],
+            "occur_datetime": row[4].strftime("%Y-%m-%d %H:%M") if row[4] else None,
+            "death_count": row[5] or 0,
+            "injury_count": row[6] or 0,
+            "vehicle_main_type": row[7],
+            "vehicle_sub_type": row[8],
+            "pedestrian_gender": row[9],
+            "pedestrian_age": float(row[10]) if row[10] is not None else None,
+            "location": row[11],
+            "police_station": row[12]
+        }
+    }
+
+@timed_query("pedestrian_map_points")
+async def _select_pedestrian_map_points(year: Optional[int] = None, accident_type: str = "all", limit: int = 10000, bbox: str = None):
+    """查詢行人事故點位原始資料列"""
+    sql, params = _pedestrian_map_points_query(year, accident_type, limit, bbox)
+    async with MySQLPool.acquire(readonly=True) as conn:
         async with conn.cursor() as cur:
-            where_clauses = []
-            params = []
-            
-            if year:
-                where_clauses.append("YEAR(occur_datetime) = %s")
-                params.append(year)
-            
-            if accident_type != "all":
-                where_clauses.append("accident_type = %s")
-                params.append(accident_type)
-            
-            where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
-            params.append(limit)
-            
-            await cur.execute(f"""
-                SELECT id, latitude, longitude, accident_type, occur_datetime,
-                       death_count, injury_count, vehicle_main_type, vehicle_sub_type,
-                       pedestrian_gender, pedestrian_age, location, police_station
-                FROM pedestrian_accidents
-                WHERE {where_sql}
-                ORDER BY occur_datetime DESC
-                LIMIT %s
-            """, params)
-            
+            await cur.execute(sql, params)
             rows = await cur.fetchall()
     
-    features = []
-    for row in rows:
-        if row[1] is not None and row[2] is not None:  # lat, lng not null
-            features.append({
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [float(row[2]), float(row[1])]  # lng, lat
-                },
-                "properties": {
-                    "id": row[0],
-                    "accident_type": row[3],
-                    "occur_datetime": row[4].strftime("%Y-%m-%d %H:%M") if row[4] else None,
-                    "death_count": row[5] or 0,
-                    "injury_count": row[6] or 0,
-                    "vehicle_main_type": row[7],
-                    "vehicle_sub_type": row[8],
-                    "pedestrian_gender": row[9],
-                    "pedestrian_age": row[10],
-                    "location": row[11],
-                    "police_station": row[12]
-                }
-            })
+    # lat, lng not null
+    return [row for row in rows if row[1] is not None and row[2] is not None]
+
+@cache_result("pedestrian", ttl=300)
+async def fetch_pedestrian_map_points(year: Optional[int] = None, accident_type: str = "all", limit: int = 10000, bbox: str = None):
+    """取得行人事故地圖點位資料"""
+    rows = await _select_pedestrian_map_points(year, accident_type, limit, bbox)
+    
+    return {
+        "type": "FeatureCollection",
+        "features": [pedestrian_point_feature(row) for row in rows]
+    }
+
+@cache_result("pedestrian", ttl=300, as_response=True, distributed_lock=True)
+async def fetch_pedestrian_map_points_response(year: Optional[int] = None, accident_type: str = "all", limit: int = 10000):
+    """完整 /api/pedestrian/map/points 回應，以編碼後位元組快取"""
+    rows = await _select_pedestrian_map_points(year, accident_type, limit)
     
     return {
         "type": "FeatureCollection",
-        "features": features
+        "features": [pedestrian_point_feature(row) for row in rows],
+        "meta": {"year": year, "accident_type": accident_type, "limit": limit}
     }
 
+@cache_bytes_result("pedestrian", ttl=300, distributed_lock=True)
+async def fetch_pedestrian_map_points_binary(year: Optional[int] = None, accident_type: str = "all", limit: int = 10000, bbox: str = None) -> bytes:
+    """取得行人事故地圖點位（二進位欄式格式）"""
+    rows = await _select_pedestrian_map_points(year, accident_type, limit, bbox)
+    
+    return (
+        PointColumns(len(rows))
+        .int64("id", (row[0] for row in rows))
+        .float32("lng", (float(row[2]) for row in rows))
+        .float32("lat", (float(row[1]) for row in rows))
+        .dictionary("accident_type", [row[3] for row in rows])
+        .uint32("occur_datetime", (epoch_seconds(row[4]) for row in rows))
+        .uint32("death_count", (row[5] or 0 for row in rows))
+        .uint32("injury_count", (row[6] or 0 for row in rows))
+        .dictionary("vehicle_main_type", [row[7] for row in rows])
+        .dictionary("pedestrian_gender", [row[9] for row in rows])
+        .to_bytes()
+    )
+
 @router.get("/pedestrian/map/points")
 async def get_pedestrian_map_points(
     year: Optional[int] = Query(None),
     accident_type: str = Query("all"),
-    limit: int = Query(10000, le=50000)
+    limit: int = Query(10000, le=50000),
+    format: str = Query("geojson", pattern="^(geojson|binary|ndjson)$"),
+    stream: bool = Query(False)
 ):
     """取得行人事故地圖點位"""
-    geojson = await fetch_pedestrian_map_points(year=year, accident_type=accident_type, limit=limit)
-    geojson["meta"] = {"year": year, "accident_type": accident_type, "limit": limit}
-    return geojson
+    meta = {"year": year, "accident_type": accident_type, "limit": limit}
+    
+    if format == "binary":
+        content = await fetch_pedestrian_map_points_binary(year=year, accident_type=accident_type, limit=limit)
+        return Response(content=content, media_type=BINARY_POINTS_MEDIA_TYPE)
+    
+    # 串流模式：伺服器端游標逐批輸出，不經快取
+    if format == "ndjson" or stream:
+        sql, params = _pedestrian_map_points_query(year, accident_type, limit)
+        batches = stream_rows(sql, params)
+        if format == "ndjson":
+            return TimedStreamingResponse(ndjson_stream(batches, pedestrian_point_feature), media_type=NDJSON_MEDIA_TYPE)
+        return TimedStreamingResponse(geojson_stream(batches, pedestrian_point_feature, meta), media_type=GEOJSON_MEDIA_TYPE)
+    
+    return await fetch_pedestrian_map_points_response(year=year, accident_type=accident_type, limit=limit)
 
 @router.get("/pedestrian/years")
+@timed_query()
 async def get_available_years():
     """取得可用年份列表"""
-    pool = await MySQLPool.create_pool()
-    async with pool.acquire() as conn:
+    async with MySQLPool.acquire(readonly=True) as conn:
         async with conn.cursor() as cur:
             await cur.execute("""
                 SELECT DISTINCT YEAR(occur_datetime) as year 
@@ -382,10 +451,10 @@ async def get_available_years():
     return {"years": years}
 
 @router.get("/pedestrian/accident-types")
+@timed_query()
 async def get_accident_types():
     """取得事故類型列表"""
-    pool = await MySQLPool.create_pool()
-    async with pool.acquire() as conn:
+    async with MySQLPool.acquire(readonly=True) as conn:
         async with conn.cursor() as cur:
             await cur.execute("""
                 SELECT DISTINCT accident_type, COUNT(*) as count
@@ -423,6 +492,7 @@ def clean_location(location):
     return location if location else "Unknown"
 
 @router.get("/pedestrian/dashboard-kpis")
+@timed_query()
 async def get_pedestrian_dashboard_kpis():
     """取得行人事故儀表板KPI資料"""
     from datetime import datetime
@@ -431,8 +501,7 @@ async def get_pedestrian_dashboard_kpis():
     target_year = current_year - 1  # 前一年
     baseline_year = 2023
     
-    pool = await MySQLPool.create_pool()
-    async with pool.acquire() as conn:
+    async with MySQLPool.acquire(readonly=True) as conn:
         async with conn.cursor() as cur:
             # 目標年度行人死亡人數
             await cur.execute("""
@@ -466,6 +535,7 @@ async def get_pedestrian_dashboard_kpis():
     }
 
 @router.get("/pedestrian/dashboard-causes")
+@timed_query()
 async def get_pedestrian_dashboard_causes():
     """取得行人事故主要肇因分析"""
     from datetime import datetime
@@ -473,8 +543,7 @@ async def get_pedestrian_dashboard_causes():
     current_year = datetime.now().year
     target_year = current_year - 1  # 前一年
     
-    pool = await MySQLPool.create_pool()
-    async with pool.acquire() as conn:
+    async with MySQLPool.acquire(readonly=True) as conn:
         async with conn.cursor() as cur:
             # 查詢主要肇因車種組合
             await cur.execute("""
@@ -521,6 +590,7 @@ async def get_pedestrian_dashboard_causes():
             }
 
 @router.get("/pedestrian/dashboard-segments")
+@timed_query()
 async def get_pedestrian_dashboard_segments():
     """取得行人事故危險路段排行"""
     from datetime import datetime
@@ -528,8 +598,7 @@ async def get_pedestrian_dashboard_segments():
     current_year = datetime.now().year
     target_year = current_year - 1  # 前一年
     
-    pool = await MySQLPool.create_pool()
-    async with pool.acquire() as conn:
+    async with MySQLPool.acquire(readonly=True) as conn:
         async with conn.cursor() as cur:
             # 查詢路段統計
             await cur.execute("""
@@ -585,14 +654,17 @@ async def get_pedestrian_dashboard_segments():
 @router.delete("/pedestrian/clear")
 async def clear_pedestrian_data():
     """清除所有行人事故資料（謹慎使用）"""
-    pool = await MySQLPool.create_pool()
-    async with pool.acquire() as conn:
+    async with MySQLPool.acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute("DELETE FROM pedestrian_accidents")
             affected_rows = cur.rowcount
     
-    # 清除快取
-    invalidate_cache_group("pedestrian")
+    # 重建群聚索引並清除快取
+    try:
+        await rebuild_pedestrian_clusters()
+    except Exception as e:
+        print(f"Rebuild pedestrian clusters error: {e}")
+    await invalidate_cache_group("pedestrian")
     
     return {
         "status": "success",
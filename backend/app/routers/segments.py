@@ -1,3 +1,5 @@
+import asyncio
+from typing import Any, List, Tuple
 from fastapi import APIRouter
 from ..queries import fetch_top_segments
 from .cms_content import fetch_dangerous_segments
@@ -6,19 +8,24 @@ from .cms_content import fetch_dangerous_segments
 router = APIRouter()
 
 
+async def resolve_top_segments(county: str, year: int, limit: int, metric: str) -> Tuple[List[Any], str]:
+    """CMS dangerous segments when present, otherwise ranked from the database"""
+    cms_segments, db_segments = await asyncio.gather(
+        fetch_dangerous_segments(year=year, county=county, limit=limit),
+        fetch_top_segments(county=county, year=year, limit=limit, metric=metric),
+        return_exceptions=True,
+    )
+    if isinstance(cms_segments, list) and cms_segments:
+        return cms_segments, "cms"
+    if isinstance(db_segments, BaseException):
+        raise db_segments
+    return db_segments, "database"
+
+
 @router.get("/segments/top")
 async def top_segments(county: str = "ALL", limit: int = 5, year: int = 2024, metric: str = "fatal_count"):
-    # 優先從CMS獲取危險路段數據
-    cms_segments = await fetch_dangerous_segments(year=year, county=county, limit=limit)
-    
-    if cms_segments:
-        # 使用CMS中的數據
-        items = cms_segments
-        data_source = "cms"
-    else:
-        # 如果CMS中沒有數據，從資料庫計算
-        items = await fetch_top_segments(county=county, year=year, limit=limit, metric=metric)
-        data_source = "database"
+    # 優先使用CMS中的危險路段數據，沒有時改用資料庫計算
+    items, data_source = await resolve_top_segments(county, year, limit, metric)
     
     return {
         "filters": {"county": county, "year": year, "metric": metric}, 
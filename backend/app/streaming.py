@@ -0,0 +1,55 @@
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Sequence
+from .db import MySQLPool, TimedSSCursor
+from .cache import dumps
+
+
+STREAM_BATCH_SIZE = 1000
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+
+
+async def stream_rows(sql: str, params: Sequence[Any], batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[list]:
+    """Yield result rows in batches from an unbuffered server-side cursor.
+
+    The connection stays checked out until the iterator is exhausted or
+    closed, so callers must consume it (StreamingResponse does).
+    """
+    async with MySQLPool.acquire(readonly=True) as conn:
+        async with conn.cursor(TimedSSCursor) as cur:
+            await cur.execute(sql, params)
+            while True:
+                rows = await cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+
+async def geojson_stream(
+    batches: AsyncIterator[list],
+    to_feature: Callable[[Any], Dict[str, Any]],
+    meta: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[bytes]:
+    """Encode row batches as one GeoJSON FeatureCollection, chunk by chunk"""
+    yield b'{"type":"FeatureCollection","features":['
+    first = True
+    async for rows in batches:
+        chunk = b",".join(dumps(to_feature(row)) for row in rows)
+        if not chunk:
+            continue
+        yield chunk if first else b"," + chunk
+        first = False
+    tail = b"]"
+    if meta is not None:
+        tail += b',"meta":' + dumps(meta)
+    yield tail + b"}"
+
+
+async def ndjson_stream(
+    batches: AsyncIterator[list],
+    to_feature: Callable[[Any], Dict[str, Any]],
+) -> AsyncIterator[bytes]:
+    """Encode row batches as newline-delimited GeoJSON features"""
+    async for rows in batches:
+        if rows:
+            yield b"".join(dumps(to_feature(row)) + b"\n" for row in rows)
@@ -0,0 +1,73 @@
+"""Per-request time breakdown (DB / Redis / CMS / serialization).
+
+``timing_middleware`` installs a dict in a context variable; code that
+talks to a backend adds its elapsed time with ``record`` or ``timed``.
+The totals are returned as a ``Server-Timing`` header, except for
+streamed responses, whose queries run after the headers are sent.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+from fastapi.responses import ORJSONResponse, StreamingResponse
+
+TIMING_KINDS = ("db", "redis", "cms", "serialize")
+# 標記 key：回應為串流，body 尚未產生，不能回報計時
+STREAMED = "streamed"
+
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+_request_path: ContextVar[Optional[str]] = ContextVar("request_path", default=None)
+
+
+def record(kind: str, seconds: float) -> None:
+    timings = _timings.get()
+    if timings is not None:
+        timings[kind] = timings.get(kind, 0.0) + seconds
+
+
+@contextmanager
+def timed(kind: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, time.perf_counter() - start)
+
+
+def current_path() -> Optional[str]:
+    return _request_path.get()
+
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    parts = [f"{kind};dur={timings[kind] * 1000:.1f}" for kind in TIMING_KINDS if kind in timings]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class TimedORJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        with timed("serialize"):
+            return super().render(content)
+
+
+class TimedStreamingResponse(StreamingResponse):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        record(STREAMED, 0.0)
+
+
+async def timing_middleware(request, call_next):
+    # 同一個 dict 會被複製到處理請求的子 task，因此可直接累加
+    timings: Dict[str, float] = {}
+    timings_token = _timings.set(timings)
+    path_token = _request_path.set(request.url.path)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _timings.reset(timings_token)
+        _request_path.reset(path_token)
+    # 串流的查詢在標頭送出後才執行，此時只會得到誤導的 db;dur=0
+    if STREAMED not in timings:
+        response.headers["Server-Timing"] = server_timing_header(timings, time.perf_counter() - start)
+    return response
@@ -42,6 +42,7 @@ echo "正在生成隨機密鑰..."
 MYSQL_ROOT_PASSWORD=$(generate_random_string 16)
 MYSQL_PASSWORD=$(generate_random_string 16)
 ETL_SECRET=$(generate_random_string 32)
+CMS_WEBHOOK_SECRET=$(generate_random_string 32)
 APP_KEYS=$(generate_random_string 32)
 API_TOKEN_SALT=$(generate_random_string 32)
 ADMIN_JWT_SECRET=$(generate_random_string 32)
@@ -61,6 +62,7 @@ REDIS_URL=redis://redis:6379/0
 
 # ==================== Backend (FastAPI) 設定 ====================
 ETL_SECRET=${ETL_SECRET}
+CMS_WEBHOOK_SECRET=${CMS_WEBHOOK_SECRET}
 
 # ==================== Strapi CMS 設定 ====================
 # 這些密鑰用於加密和驗證，請妥善保管
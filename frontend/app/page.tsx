@@ -3,59 +3,18 @@ import KpiCharts from './components/KpiCharts'
 import MarkdownContent from './components/MarkdownContent'
 import { getCmsBaseUrl } from './utils/cms'
 
-async function getKpis(year: number, baselineYear: number) {
+async function getHomepageBundle() {
   const base = process.env.NEXT_PUBLIC_API_BASE || 'http://backend:8000/api'
   try {
-    const res = await fetch(`${base}/kpis?baseline_year=${baselineYear}&period=year:${year}`, {
-      next: { revalidate: 10, tags: ['kpis'] },
+    // 首頁設定、KPI 與危險路段一次取得（年份由後端依首頁設定決定）
+    const res = await fetch(`${base}/bundle/homepage`, {
+      next: { revalidate: 10, tags: ['cms', 'kpis', 'segments'] },
     })
     if (!res.ok) throw new Error(`HTTP ${res.status}`)
     return res.json()
   } catch (error) {
-    console.error('Failed to fetch KPIs:', error)
-    return { metrics: {} }
-  }
-}
-
-async function getHomepageSettings() {
-  const base = process.env.NEXT_PUBLIC_API_BASE || 'http://backend:8000/api'
-  try {
-    const res = await fetch(`${base}/cms/homepage-settings`, {
-      next: { revalidate: 10, tags: ['cms'] },
-    })
-    if (!res.ok) throw new Error(`HTTP ${res.status}`)
-    return res.json()
-  } catch (error) {
-    console.error('Failed to fetch homepage settings:', error)
-    return { settings: {} }
-  }
-}
-
-async function getKpiConfigs() {
-  const base = process.env.NEXT_PUBLIC_API_BASE || 'http://backend:8000/api'
-  try {
-    const res = await fetch(`${base}/cms/kpi-configs`, {
-      next: { revalidate: 10, tags: ['cms'] },
-    })
-    if (!res.ok) throw new Error(`HTTP ${res.status}`)
-    return res.json()
-  } catch (error) {
-    console.error('Failed to fetch KPI configs:', error)
-    return { configs: {} }
-  }
-}
-
-async function getTopSegments(year: number) {
-  const base = process.env.NEXT_PUBLIC_API_BASE || 'http://backend:8000/api'
-  try {
-    const res = await fetch(`${base}/segments/top?county=ALL&limit=5&year=${year}`, {
-      next: { revalidate: 10, tags: ['segments'] },
-    })
-    if (!res.ok) throw new Error(`HTTP ${res.status}`)
-    return res.json()
-  } catch (error) {
-    console.error('Failed to fetch segments:', error)
-    return { items: [] }
+    console.error('Failed to fetch homepage bundle:', error)
+    return { settings: {}, kpi_configs: {}, kpis: { metrics: {} }, segments: { items: [] } }
   }
 }
 
@@ -102,29 +61,16 @@ async function getLatestPosts() {
 }
 
 export default async function Home() {
-  // 1. 先獲取首頁設定，以確定要顯示的年份
-  const homepageSettings = await getHomepageSettings()
-  const settings = homepageSettings?.settings || {}
-
-  // 從設定中解析年份 (例如 "2025年" -> 2025)，若無設定則預設 2024
-  const yearStr = settings.kpi_section_year || '2024'
-  const yearMatch = yearStr.match(/(\d{4})/)
-  const targetYear = yearMatch ? parseInt(yearMatch[1]) : 2024
-
-  // 從設定中解析基準年，若無設定則預設 2020
-  const baselineYearStr = settings.baseline_year || '2020'
-  const baselineYearMatch = baselineYearStr.match(/(\d{4})/)
-  const baselineYear = baselineYearMatch ? parseInt(baselineYearMatch[1]) : 2020
-
-  // 2. 根據年份並行獲取其他數據
-  const [kpis, segments, kpiConfigs, latestPosts] = await Promise.all([
-    getKpis(targetYear, baselineYear),
-    getTopSegments(targetYear),
-    getKpiConfigs(),
+  const [bundle, latestPosts] = await Promise.all([
+    getHomepageBundle(),
     getLatestPosts()
   ])
 
-  const configs = kpiConfigs?.configs || {}
+  const settings = bundle?.settings || {}
+  const baselineYear = bundle?.baseline_year || 2020
+  const kpis = bundle?.kpis
+  const segments = bundle?.segments
+  const configs = bundle?.kpi_configs || {}
 
   return (
     <main style={{ maxWidth: '1280px', margin: '0 auto', padding: '2rem 1rem' }}>
@@ -5,9 +5,9 @@ USE traffic;
 
 -- ==================== 主要資料表 ====================
 
--- 1. 事故明細表
+-- 1. 事故明細表（依 year 分區；ETL 以 EXCHANGE PARTITION 整年替換，缺少的年度分區由 ETL 自動切出）
 CREATE TABLE IF NOT EXISTS `accident` (
-    `id` BIGINT AUTO_INCREMENT PRIMARY KEY COMMENT '事故ID',
+    `id` BIGINT AUTO_INCREMENT COMMENT '事故ID',
     `occur_dt` DATETIME NOT NULL COMMENT '發生時間',
     `year` INT GENERATED ALWAYS AS (YEAR(occur_dt)) STORED COMMENT '年份',
     `month` TINYINT GENERATED ALWAYS AS (MONTH(occur_dt)) STORED COMMENT '月份',
@@ -27,13 +27,27 @@ CREATE TABLE IF NOT EXISTS `accident` (
     `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '建立時間',
     `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新時間',
     
+    PRIMARY KEY (`id`, `year`),
     INDEX `idx_occur_dt` (`occur_dt`),
     INDEX `idx_year_month` (`year`, `month`),
     INDEX `idx_county` (`county`),
     INDEX `idx_severity` (`severity`),
     INDEX `idx_victim_type` (`victim_type`),
     INDEX `idx_location` (`lat`, `lng`)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='事故明細表';
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='事故明細表'
+PARTITION BY RANGE (`year`) (
+    PARTITION p_before VALUES LESS THAN (2018),
+    PARTITION p2018 VALUES LESS THAN (2019),
+    PARTITION p2019 VALUES LESS THAN (2020),
+    PARTITION p2020 VALUES LESS THAN (2021),
+    PARTITION p2021 VALUES LESS THAN (2022),
+    PARTITION p2022 VALUES LESS THAN (2023),
+    PARTITION p2023 VALUES LESS THAN (2024),
+    PARTITION p2024 VALUES LESS THAN (2025),
+    PARTITION p2025 VALUES LESS THAN (2026),
+    PARTITION p2026 VALUES LESS THAN (2027),
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
 
 -- 2. KPI 基準年資料表
 CREATE TABLE IF NOT EXISTS `kpi_baseline` (
@@ -88,6 +102,49 @@ CREATE TABLE IF NOT EXISTS `pedestrian_accidents` (
     INDEX `idx_accident_type` (`accident_type`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='行人事故資料表';
 
+-- 5. KPI 彙總表（由 ETL 維護，供 /api/kpis 直接讀取）
+CREATE TABLE IF NOT EXISTS `kpi_rollup` (
+    `year` INT NOT NULL COMMENT '年份',
+    `month` TINYINT NOT NULL COMMENT '月份',
+    `severity` VARCHAR(10) NOT NULL DEFAULT '' COMMENT '嚴重程度',
+    `victim_type` VARCHAR(20) NOT NULL DEFAULT '' COMMENT '被害者類型',
+    `age_group` VARCHAR(10) NOT NULL DEFAULT '' COMMENT '年齡組別',
+    `accident_count` INT NOT NULL DEFAULT 0 COMMENT '事故數',
+    `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新時間',
+    
+    PRIMARY KEY (`year`, `month`, `severity`, `victim_type`, `age_group`),
+    INDEX `idx_year_severity` (`year`, `severity`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='KPI彙總表';
+
+-- 既有事故資料補建彙總（已存在的列由 IGNORE 保留）
+INSERT IGNORE INTO `kpi_rollup` (`year`, `month`, `severity`, `victim_type`, `age_group`, `accident_count`)
+SELECT
+    `year`,
+    `month`,
+    COALESCE(`severity`, ''),
+    COALESCE(`victim_type`, ''),
+    COALESCE(`age_group`, ''),
+    COUNT(*)
+FROM `accident`
+GROUP BY `year`, `month`, COALESCE(`severity`, ''), COALESCE(`victim_type`, ''), COALESCE(`age_group`, '');
+
+-- 6. 地圖群聚格網（各縮放等級的點位彙總，由 ETL／行人上傳後重建）
+CREATE TABLE IF NOT EXISTS `map_cluster_grid` (
+    `source` VARCHAR(20) NOT NULL COMMENT '資料來源(accident/pedestrian)',
+    `year` INT NOT NULL COMMENT '年份',
+    `category` VARCHAR(50) NOT NULL DEFAULT '' COMMENT '事故類別',
+    `zoom` TINYINT NOT NULL COMMENT '縮放等級',
+    `cell_x` INT NOT NULL COMMENT '格網X',
+    `cell_y` INT NOT NULL COMMENT '格網Y',
+    `point_count` INT NOT NULL DEFAULT 0 COMMENT '點位數',
+    `fatal_count` INT NOT NULL DEFAULT 0 COMMENT '死亡數',
+    `sum_lat` DOUBLE NOT NULL DEFAULT 0 COMMENT '緯度總和',
+    `sum_lng` DOUBLE NOT NULL DEFAULT 0 COMMENT '經度總和',
+    
+    PRIMARY KEY (`source`, `year`, `zoom`, `category`, `cell_x`, `cell_y`),
+    INDEX `idx_lookup` (`source`, `zoom`, `year`, `cell_x`, `cell_y`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='地圖群聚格網';
+
 -- ==================== 初始化基礎資料 ====================
 
 -- 插入 KPI 基準年資料（2020年作為基準）
@@ -1,11 +1,14 @@
 import os
+import numpy as np
 import pandas as pd
 import requests
 from urllib.parse import urlparse
 from datetime import datetime
 import pymysql
+import redis
 import tempfile
 import json
+import time
 
 
 def download_file(url: str) -> str:
@@ -23,7 +26,7 @@ def download_file(url: str) -> str:
         return tmp.name
 
 
-def get_db_connection():
+def get_db_connection(local_infile: bool = False):
     """Get MySQL connection"""
     return pymysql.connect(
         host=os.getenv('MYSQL_HOST', 'mysql'),
@@ -31,7 +34,8 @@ def get_db_connection():
         user=os.getenv('MYSQL_USER', 'traffic'),
         password=os.getenv('MYSQL_PASSWORD', 'changeme'),
         database='traffic',
-        charset='utf8mb4'
+        charset='utf8mb4',
+        local_infile=local_infile
     )
 
 
@@ -79,55 +83,283 @@ def clean_accident_data(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def insert_accident_data(df: pd.DataFrame, year: int, month: int = None):
-    """Insert accident data into MySQL"""
-    connection = get_db_connection()
+ACCIDENT_COLUMNS = (
+    'occur_dt', 'lat', 'lng', 'severity', 'victim_type', 'age_group',
+    'vehicle_type', 'cause_primary', 'cause_primary_rank',
+    'accident_category', 'road_segment_id'
+)
+DATETIME_COLUMNS = ('occur_dt',)
+FLOAT_COLUMNS = ('lat', 'lng')
+INT_COLUMNS = ('cause_primary_rank', 'road_segment_id')
+
+# Rows per INSERT / LOAD DATA statement; keeps packets and client memory bounded
+LOAD_CHUNK_ROWS = int(os.getenv('ETL_LOAD_CHUNK_ROWS', '5000'))
+# 'insert' (multi-row INSERT) or 'infile' (LOAD DATA LOCAL INFILE, needs --local-infile=1 on the server)
+LOAD_METHOD = os.getenv('ETL_LOAD_METHOD', 'insert')
+
+# Matches the ESCAPED BY '\\' clause of our LOAD DATA statement (independent of sql_mode)
+TSV_ESCAPES = str.maketrans({
+    '\0': '\\0', '\n': '\\n', '\r': '\\r', '\t': '\\t', '\\': '\\\\'
+})
+
+# MySQL errors meaning LOAD DATA LOCAL is disabled on the client or server
+LOCAL_INFILE_DISABLED = (1148, 2068, 3948)
+
+
+def column_literals(df: pd.DataFrame, col: str, null: str, literal, quote: str = '') -> np.ndarray:
+    """Convert one DataFrame column to an array of SQL/TSV text, column-at-a-time
+
+    ``literal`` turns a text value into its SQL/TSV form; ``quote`` wraps
+    datetimes, which never need escaping.
+    """
+    values = df[col] if col in df.columns else pd.Series(None, index=df.index, dtype=object)
+    
+    if col in DATETIME_COLUMNS:
+        values = pd.to_datetime(values, errors='coerce')
+        text = (quote + values.dt.strftime('%Y-%m-%d %H:%M:%S') + quote).to_numpy(dtype=object)
+        return np.where(values.isna().to_numpy(), null, text)
+    if col in FLOAT_COLUMNS:
+        values = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+        # lat/lng are DECIMAL(9,6)
+        return np.where(np.isnan(values), null, np.char.mod('%.6f', values).astype(object))
+    
+    # Category-like columns: convert each distinct value once, then index by code (-1 = missing)
+    if col in INT_COLUMNS:
+        codes, uniques = pd.factorize(pd.to_numeric(values, errors='coerce').round().astype('Int64'))
+        lookup = [str(value) for value in uniques]
+    else:
+        codes, uniques = pd.factorize(values)
+        lookup = [literal(str(value)) for value in uniques]
+    return np.array(lookup + [null], dtype=object)[codes]
+
+
+def accident_rows_sql(connection, df: pd.DataFrame) -> str:
+    """Build the VALUES list of a multi-row INSERT
+
+    Text goes through ``connection.literal`` so escaping follows the
+    server's sql_mode (e.g. NO_BACKSLASH_ESCAPES).
+    """
+    columns = [column_literals(df, col, 'NULL', connection.literal, "'") for col in ACCIDENT_COLUMNS]
+    return '(' + '),('.join(map(','.join, zip(*columns))) + ')'
+
+
+def accident_rows_tsv(df: pd.DataFrame) -> str:
+    """Build a LOAD DATA file body (tab separated, \\N for NULL)"""
+    columns = [
+        column_literals(df, col, '\\N', lambda value: value.translate(TSV_ESCAPES))
+        for col in ACCIDENT_COLUMNS
+    ]
+    return '\n'.join(map('\t'.join, zip(*columns))) + '\n'
+
+
+def load_accident_chunk(cursor, df: pd.DataFrame, method: str = 'insert', table: str = 'accident') -> int:
+    """Load one bounded chunk with a single statement"""
+    if df.empty:
+        return 0
+    
+    column_list = ', '.join(ACCIDENT_COLUMNS)
+    if method == 'infile':
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.tsv', delete=False) as tmp:
+            tmp.write(accident_rows_tsv(df))
+        try:
+            cursor.execute(
+                f"""
+                LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+                CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                LINES TERMINATED BY '\\n'
+                ({column_list})
+                """,
+                (tmp.name,)
+            )
+        finally:
+            os.unlink(tmp.name)
+    else:
+        cursor.execute(f"INSERT INTO {table} ({column_list}) VALUES {accident_rows_sql(cursor.connection, df)}")
+    return len(df)
+
+
+def bulk_load_accidents(cursor, frames, method: str = None, chunk_rows: int = None, table: str = 'accident') -> int:
+    """Load a DataFrame (or an iterable of DataFrame chunks) in statements of ``chunk_rows`` and report throughput"""
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    method = method or LOAD_METHOD
+    chunk_rows = chunk_rows or LOAD_CHUNK_ROWS
+    start = time.perf_counter()
+    loaded = 0
+    
+    for df in frames:
+        for offset in range(0, len(df), chunk_rows):
+            chunk = df.iloc[offset:offset + chunk_rows]
+            try:
+                loaded += load_accident_chunk(cursor, chunk, method, table)
+            except pymysql.err.OperationalError as e:
+                if method != 'infile' or e.args[0] not in LOCAL_INFILE_DISABLED:
+                    raise
+                print(f"LOAD DATA LOCAL unavailable ({e.args[1]}), falling back to multi-row INSERT")
+                method = 'insert'
+                loaded += load_accident_chunk(cursor, chunk, method, table)
+    
+    elapsed = time.perf_counter() - start
+    rate = loaded / elapsed if elapsed > 0 else 0.0
+    print(f"Loaded {loaded} rows in {elapsed:.2f}s ({rate:,.0f} rows/s, {method})")
+    return loaded
+
+
+def partition_clause(bounds) -> str:
+    """PARTITION definitions from [(name, upper year bound or None for MAXVALUE)]"""
+    return ', '.join(
+        f"PARTITION {name} VALUES LESS THAN ({'MAXVALUE' if upper is None else upper})"
+        for name, upper in bounds
+    )
+
+
+def year_partition_bounds(first_year: int, last_year: int):
+    """One partition per year, plus catch-alls below and above"""
+    return (
+        [('p_before', first_year)]
+        + [(f"p{year}", year + 1) for year in range(first_year, last_year + 1)]
+        + [('p_future', None)]
+    )
+
+
+def accident_partitions(cursor):
+    """[(name, upper bound or None)] of the accident table; [] when it is not partitioned"""
+    cursor.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+        FROM INFORMATION_SCHEMA.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE()
+            AND TABLE_NAME = 'accident'
+            AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    return [
+        (name, None if bound == 'MAXVALUE' else int(bound))
+        for name, bound in cursor.fetchall()
+    ]
+
+
+def partition_accident_table(cursor, year: int):
+    """One-off migration of an unpartitioned accident table to RANGE (year) partitions"""
+    cursor.execute("SELECT MIN(year), MAX(year) FROM accident")
+    low, high = cursor.fetchone()
+    years = [y for y in (low, high, year) if y is not None]
+    print(f"Partitioning accident table by year ({min(years)}-{max(years)})")
+    # Every unique key must include the partitioning column
+    cursor.execute(f"""
+        ALTER TABLE accident
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (id, year)
+        PARTITION BY RANGE (year) ({partition_clause(year_partition_bounds(min(years), max(years)))})
+    """)
+
+
+def ensure_year_partition(cursor, year: int) -> str:
+    """Return the partition holding exactly ``year``, splitting a catch-all partition if needed"""
+    partitions = accident_partitions(cursor)
+    if not partitions:
+        partition_accident_table(cursor, year)
+        partitions = accident_partitions(cursor)
+    
+    lower = None
+    for name, upper in partitions:
+        if upper is None or year < upper:
+            break
+        lower = upper
+    else:
+        # No MAXVALUE partition and the year is past the last bound
+        pieces = [(f"p{y}", y + 1) for y in range(lower, year + 1)]
+        cursor.execute(f"ALTER TABLE accident ADD PARTITION ({partition_clause(pieces)})")
+        return f"p{year}"
+    if lower == year and upper == year + 1:
+        return name
+    
+    # Give every year in the split range its own partition; the catch-alls keep their names
+    start = year if lower is None else lower
+    stop = year + 1 if upper is None else upper
+    pieces = [(f"p{y}", y + 1) for y in range(start, stop)]
+    if lower is None:
+        pieces.insert(0, (name, start))
+    if upper is None:
+        pieces.append((name, None))
+    print(f"Splitting partition {name} for year {year}")
+    cursor.execute(f"ALTER TABLE accident REORGANIZE PARTITION {name} INTO ({partition_clause(pieces)})")
+    return f"p{year}"
+
+
+def accident_stored_columns(cursor):
+    """Non-generated columns of the accident table, for copying rows between tables"""
+    cursor.execute("""
+        SELECT COLUMN_NAME
+        FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+            AND TABLE_NAME = 'accident'
+            AND GENERATION_EXPRESSION = ''
+        ORDER BY ORDINAL_POSITION
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def insert_accident_data(frames, year: int, month: int = None):
+    """Replace a year (or one month of it) of accident data
+
+    ``frames`` is a cleaned DataFrame or an iterable of cleaned chunks.
+    Rows are loaded into a staging table and swapped in with
+    ``EXCHANGE PARTITION``, so readers see either the old or the new year.
+    """
+    connection = get_db_connection(local_infile=LOAD_METHOD == 'infile')
+    staging = f"accident_staging_{int(year)}"
     try:
         with connection.cursor() as cursor:
-            # Delete existing data for the period (if doing replace)
+            partition = ensure_year_partition(cursor, year)
+            
+            cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+            cursor.execute(f"CREATE TABLE {staging} LIKE accident")
+            cursor.execute(f"ALTER TABLE {staging} REMOVE PARTITIONING")
+            # Continue the live id sequence so ids stay unique after the swap
+            cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM accident")
+            cursor.execute(f"ALTER TABLE {staging} AUTO_INCREMENT = {int(cursor.fetchone()[0])}")
+            
             if month:
+                # Month reload: keep the rest of the year, replace only this month
+                columns = ', '.join(accident_stored_columns(cursor))
                 cursor.execute(
-                    "DELETE FROM accident WHERE YEAR(occur_dt) = %s AND MONTH(occur_dt) = %s",
-                    (year, month)
-                )
-            else:
-                cursor.execute(
-                    "DELETE FROM accident WHERE YEAR(occur_dt) = %s",
-                    (year,)
+                    f"INSERT INTO {staging} ({columns}) "
+                    f"SELECT {columns} FROM accident PARTITION ({partition}) WHERE month <> %s",
+                    (month,)
                 )
             
-            # Insert new data
-            insert_sql = """
-                INSERT INTO accident (
-                    occur_dt, lat, lng, severity, victim_type, age_group,
-                    vehicle_type, cause_primary, cause_primary_rank,
-                    accident_category, road_segment_id
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            data_to_insert = []
-            for _, row in df.iterrows():
-                data_to_insert.append((
-                    row['occur_dt'],
-                    row['lat'],
-                    row['lng'], 
-                    row['severity'],
-                    row['victim_type'],
-                    row['age_group'],
-                    row['vehicle_type'],
-                    row['cause_primary'],
-                    row['cause_primary_rank'],
-                    row['accident_category'],
-                    row['road_segment_id']
-                ))
-            
-            cursor.executemany(insert_sql, data_to_insert)
+            loaded = bulk_load_accidents(cursor, frames, table=staging)
+            # A partition only accepts its own year; fail before the swap rather than drop rows
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {staging} WHERE year IS NULL OR year <> %s", (year,)
+            )
+            outside = cursor.fetchone()[0]
+            if outside:
+                raise ValueError(
+                    f"{outside} records fall outside year {year}; "
+                    f"split the upload by year, nothing was replaced"
+                )
             connection.commit()
             
-            print(f"Inserted {len(data_to_insert)} accident records")
-            return len(data_to_insert)
+            # Every staged row was checked above, so the swap stays metadata-only;
+            # the old rows end up in the staging table
+            start = time.perf_counter()
+            cursor.execute(
+                f"ALTER TABLE accident EXCHANGE PARTITION {partition} WITH TABLE {staging} "
+                f"WITHOUT VALIDATION"
+            )
+            print(f"Swapped partition {partition} in {time.perf_counter() - start:.2f}s")
+            
+            print(f"Inserted {loaded} accident records")
+            return loaded
             
     finally:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        except pymysql.MySQLError as e:
+            print(f"Failed to drop {staging}: {e}")
         connection.close()
 
 
@@ -148,7 +380,7 @@ def update_segment_stats(year: int):
                     '未知' as county,
                     COUNT(*) as fatal_count
                 FROM accident 
-                WHERE YEAR(occur_dt) = %s 
+                WHERE year = %s 
                     AND severity = 'fatal'
                     AND road_segment_id IS NOT NULL
                 GROUP BY road_segment_id
@@ -161,6 +393,274 @@ def update_segment_stats(year: int):
         connection.close()
 
 
+KPI_ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS kpi_rollup (
+        year INT NOT NULL,
+        month TINYINT NOT NULL,
+        severity VARCHAR(10) NOT NULL DEFAULT '',
+        victim_type VARCHAR(20) NOT NULL DEFAULT '',
+        age_group VARCHAR(10) NOT NULL DEFAULT '',
+        accident_count INT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (year, month, severity, victim_type, age_group),
+        INDEX idx_year_severity (year, severity)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+
+KPI_ROLLUP_INSERT = """
+    INSERT INTO kpi_rollup (year, month, severity, victim_type, age_group, accident_count)
+    SELECT 
+        year,
+        month,
+        COALESCE(severity, ''),
+        COALESCE(victim_type, ''),
+        COALESCE(age_group, ''),
+        COUNT(*)
+    FROM accident
+    WHERE year = %s
+    GROUP BY year, month, COALESCE(severity, ''), COALESCE(victim_type, ''), COALESCE(age_group, '')
+"""
+
+
+def missing_rollup_years(cursor, table: str, where: str = "") -> list:
+    """Years present in accident but absent from a rollup table (e.g. right after it was created)"""
+    cursor.execute("SELECT DISTINCT year FROM accident")
+    loaded = {row[0] for row in cursor.fetchall() if row[0] is not None}
+    cursor.execute(f"SELECT DISTINCT year FROM {table} {where}")
+    built = {row[0] for row in cursor.fetchall()}
+    return sorted(loaded - built)
+
+
+def update_kpi_rollup(year: int):
+    """Rebuild the kpi_rollup rows for a year from the accident table"""
+    connection = get_db_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(KPI_ROLLUP_DDL)
+            
+            # Replace the whole year so month-only reloads stay consistent
+            cursor.execute("DELETE FROM kpi_rollup WHERE year = %s", (year,))
+            cursor.execute(KPI_ROLLUP_INSERT, (year,))
+            
+            # One-off backfill of years loaded before the rollup existed
+            for missing in missing_rollup_years(cursor, 'kpi_rollup'):
+                cursor.execute(KPI_ROLLUP_INSERT, (missing,))
+                print(f"Backfilled KPI rollup for year {missing}")
+            
+            connection.commit()
+            print(f"Updated KPI rollup for year {year}")
+            
+    finally:
+        connection.close()
+
+
+def rebuild_backend_clusters(year: int):
+    """Ask the API to rebuild the map cluster grid; the grid SQL lives with the reader in the backend"""
+    backend_url = os.getenv('BACKEND_URL', 'http://backend:8000')
+    try:
+        response = requests.post(
+            f"{backend_url}/api/etl/clusters/rebuild",
+            params={"year": year, "secret": os.getenv('ETL_SECRET', '')},
+            timeout=600
+        )
+        response.raise_for_status()
+        print(f"Map cluster grid rebuilt: {response.json()}")
+    except Exception as e:
+        print(f"Map cluster grid rebuild failed: {e}")
+
+
+def bump_data_version(name: str = "accident"):
+    """Bump the data version so version-keyed caches (map tiles) roll over"""
+    try:
+        client = redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379/0'))
+        version = client.incr(f"data_version:{name}")
+        print(f"Data version for {name} is now {version}")
+    except Exception as e:
+        print(f"Failed to bump data version: {e}")
+
+
+def warm_backend_cache():
+    """Ask the API to precompute hot cache keys and swap them in atomically"""
+    backend_url = os.getenv('BACKEND_URL', 'http://backend:8000')
+    try:
+        response = requests.post(
+            f"{backend_url}/api/etl/cache/warm",
+            params={"secret": os.getenv('ETL_SECRET', '')},
+            timeout=600
+        )
+        response.raise_for_status()
+        print(f"Cache warmed: {response.json()}")
+    except Exception as e:
+        print(f"Cache warming failed: {e}")
+
+
+# Rows per CSV / JSON chunk; peak worker memory scales with this, not with the file size
+CSV_CHUNK_ROWS = int(os.getenv('ETL_CSV_CHUNK_ROWS', '50000'))
+
+# Fixed dtypes so every chunk parses the same way; numeric columns stay text
+# here and are coerced in clean_accident_data like before
+ACCIDENT_CSV_DTYPES = {col: 'object' for col in ACCIDENT_COLUMNS}
+
+
+def read_csv_chunks(file_path: str, chunk_rows: int = None):
+    """Yield the accident columns of a CSV file in chunks of ``chunk_rows``"""
+    yield from pd.read_csv(
+        file_path,
+        dtype=ACCIDENT_CSV_DTYPES,
+        usecols=lambda col: col in ACCIDENT_CSV_DTYPES,
+        chunksize=chunk_rows or CSV_CHUNK_ROWS
+    )
+
+
+class JSONStream:
+    """Decode a JSON document one value at a time from a text file.
+
+    Only the value being decoded plus one read block is held in memory,
+    so the elements of a large top-level or ``features`` array can be
+    consumed incrementally.
+    """
+    READ_CHARS = 1 << 20
+    
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+    
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        data = self.f.read(self.READ_CHARS)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+    
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at end of file)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+    
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Invalid JSON at offset {self.pos}: expected one of {chars!r}, got {char!r}")
+        self.pos += 1
+        return char
+    
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number ending exactly at the buffer end may continue in the next block
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+    
+    def items(self):
+        """Yield the elements of the array starting at the current position"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_json_records(f):
+    """Yield GeoJSON features / array elements one by one from an open file"""
+    stream = JSONStream(f)
+    if stream.peek() == '[':
+        yield from stream.items()
+        return
+    
+    stream.expect('{')
+    document = {}
+    streamed = False
+    if stream.peek() != '}':
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key == 'features' and stream.peek() == '[':  # GeoJSON
+                yield from stream.items()
+                streamed = True
+            else:
+                document[key] = stream.value()
+            if stream.expect(',}') == '}':
+                break
+    if not streamed:
+        # A single plain object is one record
+        yield document
+
+
+def record_columns(record: dict) -> dict:
+    """Accident columns of a plain record or a GeoJSON feature"""
+    if record.get('type') != 'Feature':
+        return record
+    
+    values = record.get('properties') or {}
+    geometry = record.get('geometry') or {}
+    coordinates = geometry.get('coordinates')
+    if geometry.get('type') == 'Point' and coordinates:
+        values = {**values, 'lng': coordinates[0], 'lat': coordinates[1]}
+    return values
+
+
+def read_json_chunks(file_path: str, chunk_rows: int = None):
+    """Parse a JSON / GeoJSON file feature by feature into DataFrame chunks"""
+    chunk_rows = chunk_rows or CSV_CHUNK_ROWS
+    
+    def new_buffers():
+        return {col: [] for col in ACCIDENT_COLUMNS}, set(), 0
+    
+    def to_frame(buffers, seen, rows):
+        # Columns absent from every record stay absent so clean_accident_data applies its defaults
+        return pd.DataFrame(
+            {col: values for col, values in buffers.items() if col in seen},
+            index=pd.RangeIndex(rows)
+        )
+    
+    buffers, seen, rows = new_buffers()
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        for record in iter_json_records(f):
+            if not isinstance(record, dict):
+                continue
+            values = record_columns(record)
+            for col, column in buffers.items():
+                column.append(values.get(col))
+            seen.update(values.keys())
+            rows += 1
+            if rows >= chunk_rows:
+                yield to_frame(buffers, seen, rows)
+                buffers, seen, rows = new_buffers()
+    if rows:
+        yield to_frame(buffers, seen, rows)
+
+
+def clean_chunks(chunks, totals: dict):
+    """Clean raw chunks one at a time, counting raw rows in ``totals['processed_rows']``"""
+    for chunk in chunks:
+        totals['processed_rows'] += len(chunk)
+        yield clean_accident_data(chunk)
+
+
 def process_accident_data(payload: dict):
     """Main ETL processing function"""
     try:
@@ -169,29 +669,18 @@ def process_accident_data(payload: dict):
         # Download file
         file_path = download_file(payload['file_url'])
         
-        # Read and process data
+        # Read and process data chunk by chunk
         if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
+            chunks = read_csv_chunks(file_path)
         elif file_path.endswith(('.json', '.geojson')):
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-            if 'features' in data:  # GeoJSON
-                df = pd.json_normalize(data['features'])
-                # Flatten geometry coordinates
-                if 'geometry.coordinates' in df.columns:
-                    df['lng'] = df['geometry.coordinates'].apply(lambda x: x[0] if x else None)
-                    df['lat'] = df['geometry.coordinates'].apply(lambda x: x[1] if x else None)
-            else:
-                df = pd.json_normalize(data)
+            chunks = read_json_chunks(file_path)
         else:
             raise ValueError(f"Unsupported file format: {file_path}")
         
-        # Clean data
-        df_clean = clean_accident_data(df)
-        
-        # Insert into database
+        # Clean and insert into database
+        totals = {'processed_rows': 0}
         inserted_count = insert_accident_data(
-            df_clean, 
+            clean_chunks(chunks, totals), 
             payload['year'], 
             payload.get('month')
         )
@@ -199,13 +688,25 @@ def process_accident_data(payload: dict):
         # Update segment statistics
         update_segment_stats(payload['year'])
         
+        # Refresh precomputed KPI counts
+        update_kpi_rollup(payload['year'])
+        
+        # Rebuild server-side map clusters
+        rebuild_backend_clusters(payload['year'])
+        
+        # New data version for tile caches
+        bump_data_version()
+        
+        # Precompute hot dashboard keys, then swap them in
+        warm_backend_cache()
+        
         # Clean up temp file
         if payload['file_url'].startswith('file://'):
             os.unlink(file_path)
         
         result = {
             "success": True,
-            "processed_rows": len(df),
+            "processed_rows": totals['processed_rows'],
             "inserted_rows": inserted_count,
             "year": payload['year'],
             "month": payload.get('month'),